@@ -0,0 +1,299 @@
+import asyncio
+import socket
+from time import perf_counter
+from typing import Callable, Optional
+import log_manager
+import metrics
+import profiling
+import journal
+import capture
+import deadlines
+from networkManager import *
+from my_utils import *
+from game import BlackjackGame, Shoe, shoe_factory
+from table_server import TableManager
+from tcp import DEFAULT_BACKLOG
+
+'''asyncio server engine - serves many sessions at once on a single event loop,
+using the same wire format as the serial server in server.py'''
+
+OFFER_INTERVAL = 1.0  # seconds
+
+_log = log_manager.get_logger("async_server")
+
+
+class AdmissionControl:
+    """
+    Caps the number of active sessions. Connections over the cap get a busy reply right away
+    instead of hanging in a queue, so latency degrades predictably under load.
+    on_change(active) is called whenever the number of active sessions changes.
+    """
+
+    def __init__(self, capacity: int, on_change: Optional[Callable[[int], None]] = None):
+        self.capacity = capacity
+        self.active = 0
+        self.on_change = on_change
+
+    def try_enter(self) -> bool:
+        if self.active >= self.capacity:
+            return False
+        self.active += 1
+        if self.on_change is not None:
+            self.on_change(self.active)
+        return True
+
+    def leave(self):
+        self.active -= 1
+        if self.on_change is not None:
+            self.on_change(self.active)
+
+    def load(self) -> tuple[int, int]:
+        """(active sessions, capacity) - what the extended offer advertises"""
+        return self.active, self.capacity
+
+    def busy_reply(self) -> bytes:
+        return pack_busy(BUSY_RETRY_MS, self.capacity)
+
+
+async def recv_exact(reader: asyncio.StreamReader, n_bytes: int) -> bytes:
+    """Receive exactly n_bytes from the stream (async version of safe_recv)"""
+    try:
+        return await reader.readexactly(n_bytes)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Socket closed")
+
+
+async def handle_client_async(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    new_shoe: Callable[[str], Shoe],
+    tables: Optional[TableManager] = None,
+) -> int:
+    """Serve one session, returns the number of rounds that were played - at a shared table if tables is given"""
+    rounds_played = 0
+    session_start = perf_counter()
+    log = log_manager.session_logger(_log)
+    client_ip = writer.get_extra_info("peername")[0]
+    log.info("[SERVER] Client connected from %s", client_ip)
+    # payloads due before the next client decision, handed to the transport in one writelines
+    pending: list[bytes] = []
+    cap = capture.session(client_ip)
+    round_log = None
+    limits = deadlines.SessionDeadlines(writer.transport)
+    probe = False
+
+    try:
+        # ---- receive request ----
+        limits.phase(deadlines.REQUEST)
+        try:
+            data = await reader.readexactly(MessageLength.REQUEST.value)
+        except asyncio.IncompleteReadError as e:
+            if e.partial or limits.expired is not None:
+                raise ConnectionError("Socket closed")
+            # closed before sending a single byte - a discovery RTT probe, not a failed session
+            probe = True
+            log.debug("[SERVER] %s closed without a request", client_ip)
+            return rounds_played
+        stand_on = None
+        if data[4] == MessageType.BULK_REQUEST.value:
+            # a bulk request is longer - the rest of it follows
+            data += await recv_exact(reader, MessageLength.BULK_REQUEST.value - MessageLength.REQUEST.value)
+            num_rounds, client_name, stand_on = unpack_bulk_request(data)
+        else:
+            num_rounds, client_name = unpack_request(data)
+        cap.request(data, client_name)
+        metrics.REQUEST.observe(perf_counter() - session_start)
+        limits.clear()
+
+        log.info("[SERVER] Client '%s' requested %d rounds", client_name, num_rounds)
+        profiling.annotate(client_name=client_name, requested_rounds=num_rounds, bulk=stand_on is not None)
+        round_log = journal.session(client_name, bulk=stand_on is not None)
+
+        if tables is not None and stand_on is None:
+            # the table plays the session, this only waits for it to leave its seat
+            seat = tables.seat(reader, writer, client_name, num_rounds, cap, round_log, log)
+            await seat.done
+            rounds_played = seat.rounds_played
+            if seat.error is not None:
+                raise seat.error
+            if seat.timed_out:
+                # counted in turn_timeouts_total and warned about by the table, not a client error
+                log.info("[SERVER] %s left its table after a missed turn", client_name)
+                return rounds_played
+            metrics.SESSIONS.inc()
+            log.info("[SERVER] Finished table session with %s", client_name)
+            return rounds_played
+
+        game = BlackjackGame(new_shoe(client_name))
+
+        if stand_on is not None:
+            # bulk mode - no decisions over the wire, the results go out in large batches
+            for records in game.play_bulk(num_rounds, stand_on, on_round=round_log.round):
+                header = pack_bulk_header(len(records) // BULK_RECORD_LENGTH)
+                writer.write(header)
+                writer.write(records)
+                cap.server(header)
+                cap.server(records)
+                # a client that stops reading misses the decision deadline here, as it would in interactive play
+                limits.phase(deadlines.DECISION)
+                await writer.drain()
+                limits.clear()
+                await asyncio.sleep(0)  # let the other sessions on the loop have a turn between batches
+                rounds_played += len(records) // BULK_RECORD_LENGTH
+            metrics.ROUNDS.inc(rounds_played)
+            metrics.SESSIONS.inc()
+            log.info("[SERVER] Finished bulk session with %s", client_name)
+            return rounds_played
+
+        for round_idx in range(1, num_rounds + 1):
+            rnd = game.new_round()
+
+            # ---- initial 3 cards (and the loss right away on two aces) ----
+            for card, state in rnd.deal():
+                payload = pack_server_payload(card, state)
+                pending.append(payload)
+                cap.server(payload)
+
+            # ---- player turn, then the dealer turn once the player stands ----
+            while not rnd.over:
+                limits.phase(deadlines.DECISION)  # a slow reader counts against the decision too
+                start = perf_counter()
+                writer.writelines(pending)
+                pending.clear()
+                await writer.drain()
+                sent = perf_counter()
+                metrics.WRITE.observe(sent - start)
+                frame = await recv_exact(reader, MessageLength.CLIENT_PAYLOAD.value)
+                cap.client(frame)
+                limits.clear()
+                decision = unpack_client_payload(frame)
+                metrics.DECISION.observe(perf_counter() - sent)
+                metrics.DECISIONS.inc()
+
+                if decision == PlayerDecision.HIT:
+                    sends = rnd.decide(decision)
+                else:
+                    dealer_start = perf_counter()
+                    sends = rnd.decide(decision)
+                    metrics.DEALER.observe(perf_counter() - dealer_start)
+                for card, state in sends:
+                    payload = pack_server_payload(card, state)
+                    pending.append(payload)
+                    cap.server(payload)
+
+            round_log.round(rnd.player_hand, rnd.dealer_hand, rnd.result)
+            rounds_played += 1
+            metrics.ROUNDS.inc()
+
+        start = perf_counter()
+        writer.writelines(pending)
+        await writer.drain()
+        metrics.WRITE.observe(perf_counter() - start)
+        metrics.SESSIONS.inc()
+        log.info("[SERVER] Finished session with %s", client_name)
+
+    except (ConnectionError, ValueError) as e:
+        if limits.expired is not None:
+            # the deadline aborted the connection, that is what the read or drain ran into
+            log.warning("[SERVER] Client timed out, %s deadline missed", limits.expired)
+        else:
+            metrics.SESSION_ERRORS.inc()
+            log.warning("[SERVER] Client error: %s", e)
+
+    finally:
+        limits.close()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+        if round_log is not None:
+            round_log.close()
+        cap.close()
+        profiling.annotate(rounds_played=rounds_played)
+        if not probe:
+            metrics.SESSION.observe(perf_counter() - session_start)
+        log.info("[SERVER] Connection closed for %s", client_ip)
+    return rounds_played
+
+
+async def serve_async(
+    server_sock: socket.socket,
+    server_name: str,
+    max_sessions: int = DEFAULT_MAX_SESSIONS,
+    announce: bool = True,
+    on_session_done: Optional[Callable[[int], None]] = None,
+    new_shoe: Callable[[str], Shoe] = shoe_factory(),
+    backlog: int = DEFAULT_BACKLOG,
+    admission: Optional[AdmissionControl] = None,
+    tables: Optional[TableManager] = None,
+):
+    """
+    Run the asyncio engine on an already listening server socket.
+
+    announce=False leaves offer broadcasting to someone else (the worker parent).
+    on_session_done(rounds_played) is called after every finished session.
+    new_shoe(client_name) builds the shoe each session deals from.
+    admission defaults to a cap of max_sessions active sessions.
+    with tables, interactive sessions are seated at shared tables instead of getting a dealer each.
+    """
+    if admission is None:
+        admission = AdmissionControl(max_sessions)
+
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        metrics.ACCEPTED.inc()
+        if not admission.try_enter():
+            # full - tell the client right away instead of letting the connection hang
+            metrics.BUSY.inc()
+            writer.write(admission.busy_reply())
+            writer.close()
+            return
+        try:
+            # a sampled session profiles the whole event loop while it runs, other sessions included
+            with profiling.session_profile(writer.get_extra_info("peername")[0], "async"):
+                rounds_played = await handle_client_async(reader, writer, new_shoe, tables)
+        finally:
+            admission.leave()
+        if on_session_done is not None:
+            on_session_done(rounds_played)
+
+    tcp_port = server_sock.getsockname()[1]
+    server = await asyncio.start_server(on_connect, sock=server_sock, backlog=backlog)
+    announcer = None
+    if announce:
+        announcer = OfferAnnouncer(server_name, tcp_port, OFFER_INTERVAL, load_provider=admission.load)
+    if announcer is not None:
+        announcer.start()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if announcer is not None:
+            announcer.stop()
+
+
+def run_async_server(
+    server_sock: socket.socket,
+    server_name: str,
+    max_sessions: int = DEFAULT_MAX_SESSIONS,
+    new_shoe: Callable[[str], Shoe] = shoe_factory(),
+    backlog: int = DEFAULT_BACKLOG,
+    metrics_port: Optional[int] = None,
+    tables: Optional[TableManager] = None,
+):
+    """Blocking entry point for the asyncio engine"""
+    print(f"[SERVER] Async engine started, up to {max_sessions} concurrent sessions")
+    if tables is not None:
+        print(f"[SERVER] Seating players at tables of {tables.size}, {tables.turn_timeout:.1f}s per turn")
+    stats = metrics.MetricsServer(metrics_port) if metrics_port is not None else None
+    if stats is not None:
+        stats.start()
+        print(f"[SERVER] Metrics on 127.0.0.1:{stats.port}")
+    try:
+        asyncio.run(serve_async(server_sock, server_name, max_sessions, new_shoe=new_shoe, backlog=backlog,
+                                tables=tables))
+    except KeyboardInterrupt:
+        print("[SERVER] Shutting down.")
+    finally:
+        if stats is not None:
+            stats.stop()
@@ -0,0 +1,121 @@
+import itertools
+import json
+import os
+import struct
+import time
+from typing import Optional
+
+'''session capture for replay.py - records every framed message of a session (the request, the client
+decisions, the server payloads) with its time offset from the session start.
+frames are kept in memory and written out as one file per session when it ends.
+replies only reproduce if the server deals from seeded shoes, so the seed goes into the capture'''
+
+MAGIC = b"BJCAP1\n"
+FRAME = struct.Struct("<dBH")  # time offset (s), direction, frame length
+FROM_CLIENT = 0
+FROM_SERVER = 1
+
+_config = {
+    "directory": None,
+    "seed": None,
+}
+_seq = itertools.count(1)
+
+
+class SessionCapture:
+    """The frames of one session"""
+
+    def __init__(self, client_ip: str):
+        self.client_ip = client_ip
+        self.client_name = ""
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._frames: list[bytes] = []
+
+    def _add(self, direction: int, data):
+        data = bytes(data)
+        self._frames.append(FRAME.pack(time.perf_counter() - self._start, direction, len(data)))
+        self._frames.append(data)
+
+    def request(self, data, client_name: str):
+        """The request that opened the session"""
+        self.client_name = client_name
+        self._add(FROM_CLIENT, data)
+
+    def client(self, data):
+        """A frame the client sent"""
+        self._add(FROM_CLIENT, data)
+
+    def server(self, data):
+        """A frame the server sent"""
+        self._add(FROM_SERVER, data)
+
+    def close(self):
+        if not self._frames:
+            # no request came (a probe, a busy or aborted connection) - nothing to replay
+            return
+        meta = {
+            "client_ip": self.client_ip,
+            "client_name": self.client_name,
+            "seed": _config["seed"],
+            "start": self.start_time,
+        }
+        path = os.path.join(_config["directory"], f"{os.getpid()}-{next(_seq):06d}.cap")
+        try:
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+                f.write(json.dumps(meta).encode() + b"\n")
+                f.write(b"".join(self._frames))
+        except OSError as e:
+            print(f"[CAPTURE] Could not write {path}: {e}")
+
+
+class _NoCapture:
+    """Stand-in when capturing is off"""
+    __slots__ = ()
+
+    def request(self, data, client_name: str):
+        pass
+
+    def client(self, data):
+        pass
+
+    def server(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+_NO_CAPTURE = _NoCapture()
+
+
+def configure(directory: str, seed: Optional[str] = None):
+    """Capture every session into directory, seed is the --seed the server deals with"""
+    os.makedirs(directory, exist_ok=True)
+    _config.update(directory=directory, seed=seed)
+
+
+def session(client_ip: str):
+    """Capture for one session - does nothing if capturing is off"""
+    if _config["directory"] is None:
+        return _NO_CAPTURE
+    return SessionCapture(client_ip)
+
+
+def load(path: str) -> tuple[dict, list]:
+    """Read a capture file: (metadata, [(time offset, direction, frame bytes), ...])"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session capture")
+    header_end = data.index(b"\n", len(MAGIC))
+    meta = json.loads(data[len(MAGIC):header_end])
+    frames = []
+    pos = header_end + 1
+    while pos + FRAME.size <= len(data):
+        offset, direction, length = FRAME.unpack_from(data, pos)
+        pos += FRAME.size
+        frames.append((offset, direction, data[pos:pos + length]))
+        pos += length
+    return meta, frames
@@ -1,12 +1,21 @@
 import sys
+import time
+import argparse
+import logging
+import log_manager
 from networkManager import *
 from my_utils import *
+from strategy import strategy_table, stand_on_table, MAX_UPCARD
+from discovery import ServerDirectory
 
 
 CLIENT_NAME = "birds are NOT real"
 
+_log = log_manager.get_logger("client")
+
 
 def prompt_num_rounds() -> int:
+    log_manager.flush()  # let queued output reach the console before the prompt
     while True:
         choice = input("Enter number of rounds to play (or 'q' to quit): ").strip().lower()
         if choice == "q":
@@ -17,6 +26,7 @@ def prompt_num_rounds() -> int:
 
 
 def ask_player_decision() -> PlayerDecision:
+    log_manager.flush()  # let queued output reach the console before the prompt
     while True:
         action = input("Choose action [H]it / [S]tand: ").strip().lower()
         if action in ("h", "hit"):
@@ -26,21 +36,25 @@ def ask_player_decision() -> PlayerDecision:
         print("[CLIENT] Invalid input.")
 
 
-def play_game(tcp_sock: socket.socket, num_rounds: int):
+def play_game(tcp_sock: socket.socket, num_rounds: int, autoplay: bool = False):
     stats = {"wins": 0, "losses": 0, "ties": 0}
+    reader = FrameReader(tcp_sock)
+    # autoplay decisions are a single lookup in the precomputed strategy table
+    strategy = strategy_table() if autoplay else None
+    verbose = _log.isEnabledFor(logging.INFO)
 
     # ---- send request ----
     tcp_sock.sendall(pack_request(num_rounds, CLIENT_NAME))
 
     for round_idx in range(1, num_rounds + 1):
-        print(f"\n[CLIENT] ===== Round {round_idx} =====")
+        _log.info("\n[CLIENT] ===== Round %d =====", round_idx)
 
-        player_hand: list[Card] = []
-        dealer_hand: list[Card] = []
+        player_hand = Hand()
+        dealer_hand = Hand()
 
         # ---- INITIAL DEAL: 3 cards ----
         for i in range(3):
-            data = safe_recv(tcp_sock, MessageLength.SERVER_PAYLOAD.value)
+            data = reader.read_frame(MessageLength.SERVER_PAYLOAD.value)
             card, state = unpack_server_payload(data)
 
             if i < 2:
@@ -48,72 +62,89 @@ def play_game(tcp_sock: socket.socket, num_rounds: int):
             else:
                 dealer_hand.append(card)
 
-        print(f"[CLIENT] Your hand: {', '.join(map(str, player_hand))}")
-        print(f"[CLIENT] Your card values sum: {sum(c.value() for c in player_hand)}")
-        print(f"[CLIENT] Dealer shows: {dealer_hand[0]}")
+        if verbose:
+            _log.info("[CLIENT] Your hand: %s", player_hand)
+            _log.info("[CLIENT] Your card values sum: %d", player_hand.total)
+            _log.info("[CLIENT] Dealer shows: %s", dealer_hand[0])
 
         # ---- PLAYER TURN ----
         round_over = False
+        if player_hand.busted:
+            # two aces - the server ends the round right away without asking for a decision
+            data = reader.read_frame(MessageLength.SERVER_PAYLOAD.value)
+            card, state = unpack_server_payload(data)
+            stats["losses"] += 1
+            _log.info("[CLIENT] You lost this round.")
+            round_over = True
+
         while not round_over:
             # ask player for action
-            decision = ask_player_decision()
+            if strategy is not None:
+                hit = strategy[player_hand.total * MAX_UPCARD + dealer_hand[0].value()]
+                decision = PlayerDecision.HIT if hit else PlayerDecision.STAND
+                _log.info("[CLIENT] Autoplay: %s", decision.name)
+            else:
+                decision = ask_player_decision()
             tcp_sock.sendall(pack_client_payload(decision))
 
             if decision == PlayerDecision.STAND:
                 break  # exit player's turn loop
 
             # if HIT, receive next card
-            data = safe_recv(tcp_sock, MessageLength.SERVER_PAYLOAD.value)
+            data = reader.read_frame(MessageLength.SERVER_PAYLOAD.value)
             card, state = unpack_server_payload(data)
             player_hand.append(card)
-            print(f"[CLIENT] You drew: {card}")
-            print(f"[CLIENT] Your hand: {', '.join(map(str, player_hand))}")
-            print(f"[CLIENT] Your card values sum: {sum(c.value() for c in player_hand)}")
-            print(f"[CLIENT] Dealer shows: {dealer_hand[0]}")
+            if verbose:
+                _log.info("[CLIENT] You drew: %s", card)
+                _log.info("[CLIENT] Your hand: %s", player_hand)
+                _log.info("[CLIENT] Your card values sum: %d", player_hand.total)
+                _log.info("[CLIENT] Dealer shows: %s", dealer_hand[0])
             if state != GameState.NOT_OVER:
                 # round ended immediately after HIT (bust)
                 if state == GameState.WIN:
                     stats["wins"] += 1
-                    print("[CLIENT] You won this round!")
+                    _log.info("[CLIENT] You won this round!")
                 elif state == GameState.LOSS:
                     stats["losses"] += 1
-                    print("[CLIENT] You lost this round.")
+                    _log.info("[CLIENT] You lost this round.")
                 else:
                     stats["ties"] += 1
-                    print("[CLIENT] This round is a tie.")
+                    _log.info("[CLIENT] This round is a tie.")
                 round_over = True
                 break
 
         # ---- DEALER TURN ----
         while not round_over:
-            data = safe_recv(tcp_sock, MessageLength.SERVER_PAYLOAD.value)
+            data = reader.read_frame(MessageLength.SERVER_PAYLOAD.value)
             card, state = unpack_server_payload(data)
             dealer_hand.append(card)
-            print(f"[CLIENT] Dealer drew: {card}")
-            print(f"[CLIENT] Your hand: {', '.join(map(str, player_hand))}")
-            print(f"[CLIENT] Your card values sum: {sum(c.value() for c in player_hand)}")
-            print(f"[CLIENT] Dealer shows: {', '.join(map(str, dealer_hand))}")
-            print(f"[CLIENT] Dealer card values sum: {sum(c.value() for c in dealer_hand)}")
+            if verbose:
+                _log.info("[CLIENT] Dealer drew: %s", card)
+                _log.info("[CLIENT] Your hand: %s", player_hand)
+                _log.info("[CLIENT] Your card values sum: %d", player_hand.total)
+                _log.info("[CLIENT] Dealer shows: %s", dealer_hand)
+                _log.info("[CLIENT] Dealer card values sum: %d", dealer_hand.total)
             if state != GameState.NOT_OVER:
                 if state == GameState.WIN:
                     stats["wins"] += 1
-                    print("[CLIENT] You won this round!")
+                    _log.info("[CLIENT] You won this round!")
                 elif state == GameState.LOSS:
                     stats["losses"] += 1
-                    print("[CLIENT] You lost this round.")
+                    _log.info("[CLIENT] You lost this round.")
                 else:
                     stats["ties"] += 1
-                    print("[CLIENT] This round is a tie.")
+                    _log.info("[CLIENT] This round is a tie.")
                 round_over = True
                 break
 
         # ---- round summary ----
         total_played = sum(stats.values())
         win_ratio = stats["wins"] / total_played if total_played else 0
-        print(f"[CLIENT] Win ratio so far: {win_ratio:.2f}")
+        _log.info("[CLIENT] Win ratio so far: %.2f", win_ratio)
 
     # ---- all rounds done ----
     total_played = sum(stats.values())
+    # the summaries are the output, printed whatever the log level (--quiet keeps them)
     print("\n[CLIENT] ===== Game Over =====")
     print(f"[CLIENT] Played: {total_played}")
     print(f"[CLIENT] Wins: {stats['wins']}")
@@ -122,37 +153,100 @@ def play_game(tcp_sock: socket.socket, num_rounds: int):
     print(f"[CLIENT] Final win ratio: {stats['wins'] / total_played:.2f}")
 
 
+def play_bulk(tcp_sock: socket.socket, num_rounds: int):
+    """
+    Bulk mode: send the strategy once as a stand-on total per dealer upcard, the server plays
+    every round by itself and streams back (result, player total, dealer total) per round
+    """
+    tcp_sock.sendall(pack_bulk_request(num_rounds, CLIENT_NAME, stand_on_table()))
+
+    results = {GameState.WIN.value: 0, GameState.LOSS.value: 0, GameState.TIE.value: 0}
+    received = 0
+    start = time.perf_counter()
+    while received < num_rounds:
+        num_records = unpack_bulk_header(safe_recv(tcp_sock, MessageLength.BULK_RESULTS.value))
+        records = safe_recv(tcp_sock, num_records * BULK_RECORD_LENGTH)
+        states = records[::BULK_RECORD_LENGTH]
+        for state in results:
+            results[state] += states.count(state)
+        received += num_records
+    elapsed = time.perf_counter() - start
+
+    print("\n[CLIENT] ===== Bulk Game Over =====")
+    print(f"[CLIENT] Played: {received} ({received / elapsed if elapsed else 0.0:.0f} rounds/s)")
+    print(f"[CLIENT] Wins: {results[GameState.WIN.value]}")
+    print(f"[CLIENT] Losses: {results[GameState.LOSS.value]}")
+    print(f"[CLIENT] Ties: {results[GameState.TIE.value]}")
+    print(f"[CLIENT] Final win ratio: {results[GameState.WIN.value] / received if received else 0.0:.2f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Blackjack game client")
+    parser.add_argument("--auto", action="store_true",
+                        help="play every decision from the precomputed optimal strategy table")
+    parser.add_argument("--rounds", type=int, default=None,
+                        help="play one game of this many rounds without prompting, then exit")
+    parser.add_argument("--bulk", action="store_true",
+                        help="let the server play every round with the optimal strategy and only stream back results")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only print the game summaries, not every card")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    log_manager.configure(logging.WARNING if args.quiet else logging.INFO)
     print("[CLIENT] Client started")
 
+    # keeps listening for offers in the background, so later games can connect right away
+    directory = ServerDirectory()
+    directory.start()
+
     while True:
-        num_rounds = prompt_num_rounds()
+        num_rounds = prompt_num_rounds() if args.rounds is None else args.rounds
         if num_rounds == 0:
             print("[CLIENT] Exiting gracefully.")
             sys.exit(0)
 
-        print("[CLIENT] Listening for server offers...")
-        try:
-            server_ip, tcp_port, server_name = listen_for_offers(timeout=5.0)
-        except socket.timeout:
-            print("[CLIENT] No offers received.")
-            continue
+        server = directory.best(timeout=0)
+        if server is None:
+            print("[CLIENT] Listening for server offers...")
+            server = directory.best(timeout=5.0)
+            if server is None:
+                print("[CLIENT] No offers received.")
+                continue
 
-        print(f"[CLIENT] Connecting to {server_name} at {server_ip}:{tcp_port}")
+        print(f"[CLIENT] Connecting to {server.name} at {server.ip}:{server.tcp_port}")
         try:
-            tcp_sock = connect_to_tcp_server(server_ip, tcp_port)
+            start = time.perf_counter()
+            tcp_sock = connect_to_tcp_server(server.ip, server.tcp_port)
+            directory.record_rtt(server, time.perf_counter() - start)
         except Exception as e:
             print("[CLIENT] Connection failed:", e)
+            directory.forget(server)
             continue
 
         try:
-            play_game(tcp_sock, num_rounds)
+            if args.bulk:
+                play_bulk(tcp_sock, num_rounds)
+            else:
+                play_game(tcp_sock, num_rounds, args.auto)
+        except ServerBusyError as e:
+            print(f"[CLIENT] {server.name} is full, retrying in {e.retry_after_ms}ms")
+            directory.mark_busy(server, e.retry_after_ms / 1000)
+            time.sleep(e.retry_after_ms / 1000)
+            continue
         except Exception as e:
+            log_manager.flush()
             print("[CLIENT] Game error:", e)
         finally:
+            log_manager.flush()
             tcp_sock.close()
             print("[CLIENT] Disconnected.\n")
 
+        if args.rounds is not None:
+            break
+
 
 if __name__ == "__main__":
     main()
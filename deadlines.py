@@ -0,0 +1,131 @@
+import socket
+import weakref
+from time import monotonic
+from typing import Optional
+import metrics
+from my_utils import DEFAULT_REQUEST_TIMEOUT, DEFAULT_DECISION_TIMEOUT, DEFAULT_SESSION_TIMEOUT
+from timer_wheel import HashedTimerWheel, Timer
+
+'''per-phase session deadlines - how long a client may take to send its request, each decision,
+and the whole session. the asyncio engines keep them on one hashed timer wheel per event loop, so
+arming and disarming them per decision stays O(1) with tens of thousands of sessions open; the serial
+engine turns them into socket timeouts. a session that misses one is torn down and counted by reason.
+a limit of 0 turns that deadline off'''
+
+REQUEST = "request"
+DECISION = "decision"
+SESSION = "session"
+
+_config = {
+    REQUEST: DEFAULT_REQUEST_TIMEOUT,
+    DECISION: DEFAULT_DECISION_TIMEOUT,
+    SESSION: DEFAULT_SESSION_TIMEOUT,
+}
+_COUNTERS = {
+    REQUEST: metrics.REQUEST_TIMEOUTS,
+    DECISION: metrics.DECISION_TIMEOUTS,
+    SESSION: metrics.SESSION_TIMEOUTS,
+}
+_wheels = weakref.WeakKeyDictionary()  # event loop -> its wheel
+
+
+def configure(request: float, decision: float, session: float):
+    """Seconds allowed for the request, each decision and the whole session (0 = no limit)"""
+    _config.update({REQUEST: request, DECISION: decision, SESSION: session})
+
+
+def _loop_wheel() -> HashedTimerWheel:
+    """The wheel of the running event loop, advanced by a loop callback every tick"""
+    import asyncio  # only the asyncio engines get here, the serial server never imports it
+    loop = asyncio.get_running_loop()
+    wheel = _wheels.get(loop)
+    if wheel is None:
+        wheel = _wheels[loop] = HashedTimerWheel(clock=loop.time)
+
+        def tick():
+            wheel.advance()
+            loop.call_later(wheel.tick, tick)
+
+        loop.call_later(wheel.tick, tick)
+    return wheel
+
+
+class SessionDeadlines:
+    """
+    The deadlines of one asyncio session. phase() arms the deadline of what the session waits
+    for next and clear() disarms it once that arrived, the session deadline runs from the start.
+    Missing one aborts the connection, so the pending read or drain fails with a ConnectionError
+    and expired says which deadline it was.
+    """
+    __slots__ = ("_wheel", "_transport", "_phase", "_session", "expired")
+
+    def __init__(self, transport: "asyncio.BaseTransport"):
+        self._wheel = _loop_wheel()
+        self._transport = transport
+        self._phase: Optional[Timer] = None
+        self.expired: Optional[str] = None
+        self._session = self._arm(SESSION)
+
+    def _arm(self, reason: str) -> Optional[Timer]:
+        limit = _config[reason]
+        return self._wheel.schedule(limit, self._expire, reason) if limit else None
+
+    def phase(self, reason: str):
+        if self._phase is not None:
+            self._phase.cancel()
+        self._phase = self._arm(reason)
+
+    def clear(self):
+        if self._phase is not None:
+            self._phase.cancel()
+            self._phase = None
+
+    def close(self):
+        self.clear()
+        if self._session is not None:
+            self._session.cancel()
+            self._session = None
+
+    def _expire(self, reason: str):
+        if self.expired is None:
+            self.expired = reason
+            _COUNTERS[reason].inc()
+            self._transport.abort()
+
+
+class SocketDeadlines:
+    """
+    The same deadlines for the serial engine, as timeouts on the blocking client socket.
+    Every phase gets its limit or what is left of the session, whichever is shorter, and a phase
+    starting after the session is up times out right away - so a client trickling in its frames
+    is cut off soon after the session deadline, even though each receive has the full timeout.
+    Call expire() when the socket times out, it counts and returns the deadline that was missed.
+    """
+    __slots__ = ("_sock", "_session_end", "_reason")
+
+    def __init__(self, sock):
+        self._sock = sock
+        limit = _config[SESSION]
+        self._session_end = monotonic() + limit if limit else None
+        self._reason = SESSION
+
+    def phase(self, reason: str):
+        limit = _config[reason] or None
+        self._reason = reason
+        if self._session_end is not None:
+            left = self._session_end - monotonic()
+            if left <= 0:
+                self._reason = SESSION
+                raise socket.timeout("session deadline passed")
+            if limit is None or left < limit:
+                limit = left
+                self._reason = SESSION
+        self._sock.settimeout(limit)
+
+    def clear(self):
+        """Back to the session deadline alone (writes block for at most that long too)"""
+        self.phase(SESSION)
+
+    def expire(self) -> str:
+        _COUNTERS[self._reason].inc()
+        return self._reason
@@ -0,0 +1,162 @@
+import socket
+import threading
+import time
+from typing import Optional
+from udp import create_offer_listener, parse_offer
+from tcp import connect_to_tcp_server
+
+'''client side server directory - listens for offers in the background the whole time the client runs,
+expires servers that stopped announcing, tracks their advertised load and measures the TCP connect
+round trip time to each one, so a new game can start right away against a known, responsive server'''
+
+DEFAULT_TTL = 5.0             # seconds without an offer before a server is dropped
+DEFAULT_PROBE_INTERVAL = 30.0  # seconds between connect RTT measurements of the same server
+PROBE_TIMEOUT = 2.0
+
+
+class ServerEntry:
+    """One known server"""
+    __slots__ = ("ip", "tcp_port", "name", "last_seen", "rtt", "last_probe", "load", "busy_until")
+
+    def __init__(self, ip: str, tcp_port: int, name: str):
+        self.ip = ip
+        self.tcp_port = tcp_port
+        self.name = name
+        self.last_seen = time.monotonic()
+        self.rtt: Optional[float] = None  # seconds, None until measured
+        self.last_probe = 0.0
+        self.load: Optional[tuple] = None  # (active sessions, capacity) from extended offers
+        self.busy_until = 0.0  # set when the server turned us away as busy
+
+    @property
+    def full(self) -> bool:
+        """Known to have no free session slots right now"""
+        if time.monotonic() < self.busy_until:
+            return True
+        return self.load is not None and self.load[0] >= self.load[1]
+
+    @property
+    def key(self) -> tuple:
+        return self.ip, self.tcp_port
+
+    def __repr__(self):
+        rtt = f"{self.rtt * 1000:.1f}ms" if self.rtt is not None else "?"
+        return f"{self.name}@{self.ip}:{self.tcp_port} (rtt {rtt})"
+
+
+class ServerDirectory:
+    """
+    Background discovery service.
+    One thread keeps receiving offers into the directory, another one probes the connect RTT of
+    new servers (and again every probe_interval). best() picks the fastest live server.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, probe_interval: float = DEFAULT_PROBE_INTERVAL):
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        self._entries: dict[tuple, ServerEntry] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    # ---- background threads ----
+    def _listen(self):
+        sock = create_offer_listener(timeout=0.5)
+        try:
+            while not self._stop.is_set():
+                try:
+                    data, addr = sock.recvfrom(1024)
+                except socket.timeout:
+                    continue
+                offer = parse_offer(data)
+                if offer is not None:
+                    self._on_offer(addr[0], *offer)
+        finally:
+            sock.close()
+
+    def _on_offer(self, ip: str, tcp_port: int, name: str, load: Optional[tuple]):
+        with self._lock:
+            entry = self._entries.get((ip, tcp_port))
+            if entry is None:
+                entry = self._entries[ip, tcp_port] = ServerEntry(ip, tcp_port, name)
+            else:
+                entry.name = name
+                entry.last_seen = time.monotonic()
+            if load is not None:
+                entry.load = load
+            self._changed.notify_all()
+
+    def _probe_loop(self):
+        while not self._stop.wait(0.5):
+            now = time.monotonic()
+            with self._lock:
+                due = [e for e in self._live(now) if now - e.last_probe >= self.probe_interval]
+            for entry in due:
+                self.probe(entry)
+
+    # ---- directory ----
+    def _live(self, now: float) -> list:
+        """Drop expired entries and return the rest (caller holds the lock)"""
+        for key in [k for k, e in self._entries.items() if now - e.last_seen > self.ttl]:
+            del self._entries[key]
+        return list(self._entries.values())
+
+    def probe(self, entry: ServerEntry):
+        """Measure the TCP connect round trip time of a server"""
+        entry.last_probe = time.monotonic()
+        start = time.perf_counter()
+        try:
+            sock = connect_to_tcp_server(entry.ip, entry.tcp_port, timeout=PROBE_TIMEOUT)
+        except OSError:
+            self.forget(entry)
+            return
+        self.record_rtt(entry, time.perf_counter() - start)
+        sock.close()
+
+    def record_rtt(self, entry: ServerEntry, rtt: float):
+        """Remember a measured connect time (probes and real connects both count)"""
+        with self._lock:
+            entry.rtt = rtt
+            self._changed.notify_all()
+
+    def mark_busy(self, entry: ServerEntry, retry_after: float):
+        """The server turned a session away - prefer other servers for retry_after seconds"""
+        with self._lock:
+            entry.busy_until = time.monotonic() + retry_after
+
+    def forget(self, entry: ServerEntry):
+        """Drop a server that could not be reached, until it announces itself again"""
+        with self._lock:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+
+    def servers(self) -> list:
+        """Live servers, ones with free capacity first, then fastest first (unmeasured ones last)"""
+        with self._lock:
+            entries = self._live(time.monotonic())
+        return sorted(entries, key=lambda e: (e.full, e.rtt is None, e.rtt or 0.0))
+
+    def best(self, timeout: float = 5.0) -> Optional[ServerEntry]:
+        """The fastest live server, waiting up to timeout for one to show up"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while not self._live(time.monotonic()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+        servers = self.servers()
+        return servers[0] if servers else None
+
+    def start(self):
+        for target, name in ((self._listen, "discovery-listen"), (self._probe_loop, "discovery-probe")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
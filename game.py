@@ -1,41 +1,315 @@
 import random
-from typing import List, Callable
-from my_utils import Card, Suits, GameState, PlayerDecision
+from typing import List, Callable, Iterator, Optional, Tuple
+from my_utils import Card, CARDS, NUM_CARDS, GameState, PlayerDecision, Hand
 
 '''the file to handle all game logic'''
 
+DEFAULT_DECKS = 6
+DEFAULT_PENETRATION = 0.75  # reshuffle once this fraction of the shoe has been dealt
+BULK_BATCH_ROUNDS = 4096  # rounds per batch of bulk results
+
+
+class Shoe:
+    """
+    Reusable multi-deck shoe of card ids.
+    Shuffling is lazy: every draw is one step of Fisher-Yates (pick a random card among the ones not
+    dealt yet and swap it behind them), so a reshuffle just marks every card undealt again - no deck is
+    rebuilt and only the cards actually drawn cost any work.
+    With a seed the whole card sequence is reproducible.
+    cards[:remaining] are undealt, cards[remaining:round_start] were dealt this round and
+    cards[round_start:] in earlier rounds.
+    """
+
+    def __init__(self, num_decks: int = DEFAULT_DECKS, penetration: float = DEFAULT_PENETRATION, seed=None):
+        if num_decks < 1:
+            raise ValueError("A shoe needs at least one deck")
+        if not 0 < penetration <= 1:
+            raise ValueError("Penetration must be above 0 and at most 1")
+        self.cards = bytearray(range(NUM_CARDS)) * num_decks
+        self.remaining = len(self.cards)
+        self.round_start = len(self.cards)
+        # reshuffle between rounds once no more than this many cards are left
+        self.reshuffle_at = len(self.cards) - int(len(self.cards) * penetration)
+        self._random = random.Random(seed).random
+
+    def shuffle(self):
+        """Put every card back - the actual shuffling happens draw by draw"""
+        self.remaining = self.round_start = len(self.cards)
+
+    def start_round(self):
+        """Call between rounds, reshuffles once the penetration point is passed"""
+        if self.remaining <= self.reshuffle_at:
+            self.shuffle()
+        self.round_start = self.remaining
+
+    def _reshuffle_discards(self):
+        """Out of cards mid round - put back the discards of earlier rounds, not the cards in play"""
+        cards = self.cards
+        discards = len(cards) - self.round_start
+        if discards == 0:
+            # no rounds (a bare card source), or this round used the whole shoe
+            self.shuffle()
+            return
+        # the discards move to the front as the undealt cards, this round's cards to the back
+        cards[:] = cards[self.round_start:] + cards[:self.round_start]
+        self.remaining = discards
+        self.round_start = len(cards)
+
+    def draw_id(self) -> int:
+        """Draw a card id (reshuffles the discards if the shoe ran out mid round)"""
+        remaining = self.remaining
+        if remaining == 0:
+            self._reshuffle_discards()
+            remaining = self.remaining
+        cards = self.cards
+        j = int(self._random() * remaining)
+        remaining -= 1
+        card = cards[j]
+        cards[j] = cards[remaining]
+        cards[remaining] = card
+        self.remaining = remaining
+        return card
+
+    def draw(self) -> Card:
+        return CARDS[self.draw_id()]
+
+
+def shoe_factory(
+    num_decks: int = DEFAULT_DECKS,
+    penetration: float = DEFAULT_PENETRATION,
+    seed=None,
+) -> Callable[[str], Shoe]:
+    """
+    Returns new_shoe(client_name) for per-session shoes.
+    With a seed, each session's shoe is seeded from (seed, client name), so the same client
+    playing against the same seed gets the same cards.
+    That includes every session sent under one name - they all play the very same hands. The cards
+    only depend on what the client sends, which is what lets replay.py reproduce a captured session
+    (on any worker, any number of times), so clients that want different hands per session have
+    to send different names, as loadgen.py does.
+    """
+    Shoe(num_decks, penetration)  # bad options fail here, not in every session
+
+    def new_shoe(client_name: str) -> Shoe:
+        session_seed = None if seed is None else f"{seed}:{client_name}"
+        return Shoe(num_decks, penetration, session_seed)
+    return new_shoe
+
+
+# what a round step produces - the (card, state) pairs to send to the player, in order
+Sends = List[Tuple[Card, GameState]]
+
+
+class Round:
+    """
+    One round as a resumable state machine - no sockets, no callbacks, no blocking.
+    Feed it the events (deal, then one decide per player decision until over) and send the
+    (card, state) pairs each step returns, so one loop can drive any number of tables.
+
+    What gets sent is the wire protocol of the server:
+    - deal: both player cards and the dealer upcard, then (last player card, LOSS) if the
+      player already busted (two aces) - the round is over without a decision
+    - HIT: the new card, with LOSS if it busts the player
+    - STAND: the hidden dealer card and every dealer hit while the dealer is still below 17,
+      then (last dealer card, result)
+    """
+    __slots__ = ("_draw", "player_hand", "dealer_hand", "result")
+
+    def __init__(self, game: "BlackjackGame"):
+        self._draw = game.draw_card
+        self.player_hand = Hand()
+        self.dealer_hand = Hand()
+        self.result: Optional[GameState] = None
+
+    @property
+    def over(self) -> bool:
+        return self.result is not None
+
+    def deal(self) -> Sends:
+        draw = self._draw
+        player_hand = self.player_hand = Hand((draw(), draw()))
+        dealer_hand = self.dealer_hand = Hand((draw(), draw()))
+        sends = [
+            (player_hand[0], GameState.NOT_OVER),
+            (player_hand[1], GameState.NOT_OVER),
+            (dealer_hand[0], GameState.NOT_OVER),
+        ]
+        if player_hand.busted:
+            self.result = GameState.LOSS
+            sends.append((player_hand[-1], GameState.LOSS))
+        return sends
+
+    def decide(self, decision: PlayerDecision) -> Sends:
+        if self.result is not None:
+            raise ValueError("Round is already over")
+        if decision == PlayerDecision.HIT:
+            card = self._draw()
+            self.player_hand.append(card)
+            if self.player_hand.busted:
+                self.result = GameState.LOSS
+                return [(card, GameState.LOSS)]
+            return [(card, GameState.NOT_OVER)]
+        return self._dealer_turn()
+
+    def _dealer_turn(self) -> Sends:
+        sends = _dealer_draws(self.dealer_hand, self._draw)
+        self.result = _result(self.player_hand, self.dealer_hand)
+        sends.append((self.dealer_hand[-1], self.result))
+        return sends
+
+
+def _dealer_draws(dealer_hand: Hand, draw: Callable[[], Card]) -> Sends:
+    """Reveal the hidden card and draw for as long as needed - only cards while still below 17 are sent"""
+    sends = []
+    if dealer_hand.total < 17:
+        sends.append((dealer_hand[1], GameState.NOT_OVER))
+    while dealer_hand.total < 17:
+        card = draw()
+        dealer_hand.append(card)
+        if dealer_hand.total < 17:
+            sends.append((card, GameState.NOT_OVER))
+    return sends
+
+
+def _result(player_hand: Hand, dealer_hand: Hand) -> GameState:
+    """Result of a player who stood"""
+    p = player_hand.total
+    d = dealer_hand.total
+    if d > 21 or p > d:
+        return GameState.WIN
+    if p < d:
+        return GameState.LOSS
+    return GameState.TIE
+
+
+class TableRound:
+    """
+    One round at a multi-player table - every seat plays its own hand against one shared dealer hand.
+    Same events and sends as Round, per seat: deal() once, decide(seat, ...) until seat_done(seat),
+    and once every seat is done, dealer_turn() returns the dealer cards - the same for every seat that
+    stood - and each seat's result (None for seats that busted and already got their LOSS).
+    """
+    __slots__ = ("_draw", "player_hands", "dealer_hand", "results", "_stood")
+
+    def __init__(self, game: "BlackjackGame", num_seats: int):
+        self._draw = game.draw_card
+        self.player_hands = [Hand() for _ in range(num_seats)]
+        self.dealer_hand = Hand()
+        self.results: List[Optional[GameState]] = [None] * num_seats
+        self._stood = [False] * num_seats
+
+    def deal(self) -> Tuple[Tuple[Card, GameState], List[Sends]]:
+        """
+        The shared dealer upcard and the own sends of every seat: its two cards, then (last card, LOSS)
+        on two aces. On the wire the upcard goes between the two cards and the loss, as in Round.
+        """
+        draw = self._draw
+        for hand in self.player_hands:
+            hand.append(draw())
+            hand.append(draw())
+        self.dealer_hand = Hand((draw(), draw()))
+        sends = []
+        for seat, hand in enumerate(self.player_hands):
+            seat_sends = [(hand[0], GameState.NOT_OVER), (hand[1], GameState.NOT_OVER)]
+            if hand.busted:
+                self.results[seat] = GameState.LOSS
+                seat_sends.append((hand[-1], GameState.LOSS))
+            sends.append(seat_sends)
+        return (self.dealer_hand[0], GameState.NOT_OVER), sends
+
+    def seat_done(self, seat: int) -> bool:
+        return self._stood[seat] or self.results[seat] is not None
+
+    @property
+    def players_done(self) -> bool:
+        return all(self.seat_done(seat) for seat in range(len(self.player_hands)))
+
+    def decide(self, seat: int, decision: PlayerDecision) -> Sends:
+        if self.seat_done(seat):
+            raise ValueError("Seat is already done this round")
+        if decision == PlayerDecision.HIT:
+            hand = self.player_hands[seat]
+            card = self._draw()
+            hand.append(card)
+            if hand.busted:
+                self.results[seat] = GameState.LOSS
+                return [(card, GameState.LOSS)]
+            return [(card, GameState.NOT_OVER)]
+        self._stood[seat] = True
+        return []
+
+    def dealer_turn(self) -> Tuple[Sends, List[Optional[GameState]]]:
+        """
+        The shared dealer cards and the result of every seat that stood.
+        The dealer only plays if somebody stood, and each of those seats then gets
+        the shared sends followed by (last dealer card, its result).
+        """
+        if not any(self._stood):
+            return [], [None] * len(self.player_hands)
+        sends = _dealer_draws(self.dealer_hand, self._draw)
+        stood_results = []
+        for seat, hand in enumerate(self.player_hands):
+            if self._stood[seat]:
+                self.results[seat] = _result(hand, self.dealer_hand)
+                stood_results.append(self.results[seat])
+            else:
+                stood_results.append(None)
+        return sends, stood_results
+
+
 class BlackjackGame:
     """
     Handles a single round of simplified Blackjack.
     Pure game logic – no networking, no printing, no user input.
+    Draws from the given shoe, or without one from a fresh single deck (reshuffled when empty).
     """
 
-    def __init__(self):
-        self.deck: List[Card] = self._new_shuffled_deck()
+    def __init__(self, shoe: Optional[Shoe] = None):
+        self.shoe = shoe
+        self.deck: bytearray = self._new_shuffled_deck() if shoe is None else bytearray()
 
-    def _new_shuffled_deck(self) -> List[Card]:
-        """Create and shuffle a standard 52-card deck"""
-        deck = [Card(rank, suit) for suit in Suits for rank in range(1, 14)]
+    def _new_shuffled_deck(self) -> bytearray:
+        """Create and shuffle a standard 52-card deck (as card ids, see my_utils.CARDS)"""
+        deck = bytearray(range(NUM_CARDS))
         random.shuffle(deck)
         return deck
 
+    def start_round(self):
+        """Call before dealing a round, lets the shoe reshuffle at its penetration point"""
+        if self.shoe is not None:
+            self.shoe.start_round()
+
     def draw_card(self) -> Card:
-        """Draw a card from the deck (reshuffle if empty)"""
+        """Draw a card from the shoe or deck (reshuffle if empty)"""
+        if self.shoe is not None:
+            return self.shoe.draw()
         if not self.deck:
             self.deck = self._new_shuffled_deck()
-        return self.deck.pop()
+        return CARDS[self.deck.pop()]
+
+    def new_round(self) -> "Round":
+        """Start a round (reshuffling if due), call deal() on it next"""
+        self.start_round()
+        return Round(self)
 
-    def hand_value(self, hand: List[Card]) -> int:
+    def new_table_round(self, num_seats: int) -> "TableRound":
+        """Start a round for num_seats players sharing the dealer, call deal() on it next"""
+        self.start_round()
+        return TableRound(self, num_seats)
+
+    def hand_value(self, hand) -> int:
         """
         Compute blackjack hand value.
         (Ace always counts as 11 in this simplified version)
         """
+        if isinstance(hand, Hand):
+            return hand.total
         return sum(card.value() for card in hand)
 
     def play_round(
         self,
-        player_decision_callback: Callable[[List[Card], Card], PlayerDecision]
-    ) -> tuple[List[Card], List[Card], GameState]:
+        player_decision_callback: Callable[[Hand, Card], PlayerDecision]
+    ) -> tuple[Hand, Hand, GameState]:
         """
         Play a single blackjack round.
 
@@ -47,35 +321,40 @@ class BlackjackGame:
         - GameState (WIN / LOSS / TIE)
         """
 
-        # --- Initial deal ---
-        player_hand = [self.draw_card(), self.draw_card()]
-        dealer_hand = [self.draw_card(), self.draw_card()]
-
-        # --- Player turn ---
-        while True:
-            if self.hand_value(player_hand) > 21:
-                # Player busts
-                return player_hand, dealer_hand, GameState.LOSS
-
-            decision = player_decision_callback(player_hand, dealer_hand[0])
-
-            if decision == PlayerDecision.HIT:
-                player_hand.append(self.draw_card())
-            else:  # STAND
-                break
-
-        # --- Dealer turn ---
-        while self.hand_value(dealer_hand) < 17:
-            dealer_hand.append(self.draw_card())
-
-        # --- Decide winner ---
-        player_total = self.hand_value(player_hand)
-        dealer_total = self.hand_value(dealer_hand)
-
-        if dealer_total > 21:
-            return player_hand, dealer_hand, GameState.WIN
-        if player_total > dealer_total:
-            return player_hand, dealer_hand, GameState.WIN
-        if player_total < dealer_total:
-            return player_hand, dealer_hand, GameState.LOSS
-        return player_hand, dealer_hand, GameState.TIE
+        rnd = self.new_round()
+        rnd.deal()
+        while not rnd.over:
+            rnd.decide(player_decision_callback(rnd.player_hand, rnd.dealer_hand[0]))
+        return rnd.player_hand, rnd.dealer_hand, rnd.result
+
+    def play_bulk(
+        self,
+        num_rounds: int,
+        stand_on: bytes,
+        batch_rounds: int = BULK_BATCH_ROUNDS,
+        on_round: Optional[Callable[[Hand, Hand, GameState], None]] = None,
+    ) -> Iterator[bytearray]:
+        """
+        Play num_rounds rounds without a client in the loop - the player hits while their total
+        is below stand_on[dealer upcard value].
+        Yields the results in batches of up to batch_rounds records of
+        (GameState value, player total, dealer total), one byte each.
+        on_round(player_hand, dealer_hand, state) is called after every round.
+        """
+        def decide(player_hand: Hand, dealer_card: Card) -> PlayerDecision:
+            if player_hand.total < stand_on[dealer_card.value()]:
+                return PlayerDecision.HIT
+            return PlayerDecision.STAND
+
+        batch = bytearray()
+        batch_bytes = 3 * batch_rounds
+        for _ in range(num_rounds):
+            player_hand, dealer_hand, state = self.play_round(decide)
+            if on_round is not None:
+                on_round(player_hand, dealer_hand, state)
+            batch += bytes((state._value_, player_hand.total, dealer_hand.total))
+            if len(batch) >= batch_bytes:
+                yield batch
+                batch = bytearray()
+        if batch:
+            yield batch
@@ -0,0 +1,133 @@
+import ipaddress
+import socket
+from typing import Optional, Tuple
+
+'''IPv4 interface resolution for the offer broadcasts - the interfaces are listed once and the chosen
+address is cached until invalidated. nothing here opens a connection: the interface is picked from
+the pin, the default route, or the first non-loopback interface that is up.
+psutil is only imported when the interfaces are actually listed'''
+
+LIMITED_BROADCAST = "255.255.255.255"  # fallback when no interface can be resolved
+ROUTE_TABLE = "/proc/net/route"
+
+Interface = Tuple[str, str, str]  # name, address, netmask
+
+
+def list_ipv4_interfaces() -> Tuple[Interface, ...]:
+    """(name, address, netmask) of every IPv4 interface that is up, sorted - empty without psutil"""
+    try:
+        import psutil
+    except ImportError:
+        return ()
+    stats = psutil.net_if_stats()
+    return tuple(sorted(
+        (iface, addr.address, addr.netmask)
+        for iface, addrs in psutil.net_if_addrs().items()
+        if iface not in stats or stats[iface].isup
+        for addr in addrs
+        if addr.family == socket.AF_INET and addr.netmask
+    ))
+
+
+def default_route_interface() -> Optional[str]:
+    """Name of the interface the default route goes through (Linux only, read from the route table)"""
+    try:
+        with open(ROUTE_TABLE) as f:
+            next(f)  # header
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1 and fields[1] == "00000000":
+                    return fields[0]
+    except (OSError, StopIteration):
+        pass
+    return None
+
+
+class InterfaceResolver:
+    """
+    Picks the interface the offers go out on and caches its broadcast address.
+    interface pins an interface by name, broadcast pins the address outright (no lookup at all).
+    refresh() re-lists the interfaces and drops the cached choice only if they changed.
+    """
+
+    def __init__(self, interface: Optional[str] = None, broadcast: Optional[str] = None):
+        self.interface = interface
+        self.broadcast = broadcast
+        self._interfaces: Optional[Tuple[Interface, ...]] = None
+        self._chosen: Optional[Interface] = None
+        self._resolved = False
+
+    def interfaces(self) -> Tuple[Interface, ...]:
+        if self._interfaces is None:
+            self._interfaces = list_ipv4_interfaces()
+        return self._interfaces
+
+    def invalidate(self):
+        """Forget the interface list and the choice, the next lookup lists them again"""
+        self._interfaces = None
+        self._chosen = None
+        self._resolved = False
+
+    def refresh(self) -> bool:
+        """Re-list the interfaces, returns True (and drops the cached choice) if they changed"""
+        if self.broadcast is not None:
+            return False  # a pinned address never changes, no need to list anything
+        current = list_ipv4_interfaces()
+        if current == self._interfaces:
+            return False
+        self._interfaces = current
+        self._chosen = None
+        self._resolved = False
+        return True
+
+    def chosen(self) -> Optional[Interface]:
+        """The interface offers go out on, None if there is no usable one"""
+        if not self._resolved:
+            self._chosen = self._choose(self.interfaces())
+            self._resolved = True
+        return self._chosen
+
+    def _choose(self, interfaces: Tuple[Interface, ...]) -> Optional[Interface]:
+        if self.interface is not None:
+            for entry in interfaces:
+                if entry[0] == self.interface:
+                    return entry
+            raise RuntimeError(f"No IPv4 address on interface {self.interface}")
+        usable = [e for e in interfaces if not ipaddress.IPv4Address(e[1]).is_loopback]
+        route = default_route_interface()
+        for entry in usable:
+            if entry[0] == route:
+                return entry
+        return usable[0] if usable else None
+
+    def local_ip(self) -> str:
+        entry = self.chosen()
+        return entry[1] if entry is not None else "127.0.0.1"
+
+    def netmask(self) -> str:
+        entry = self.chosen()
+        if entry is None:
+            raise RuntimeError("Could not determine subnet mask")
+        return entry[2]
+
+    def broadcast_address(self) -> str:
+        if self.broadcast is not None:
+            return self.broadcast
+        entry = self.chosen()
+        if entry is None:
+            return LIMITED_BROADCAST
+        network = ipaddress.IPv4Network(f"{entry[1]}/{entry[2]}", strict=False)
+        return str(network.broadcast_address)
+
+
+_default = InterfaceResolver()
+
+
+def configure(interface: Optional[str] = None, broadcast: Optional[str] = None):
+    """Pin the interface and/or broadcast address every announcer uses by default"""
+    global _default
+    _default = InterfaceResolver(interface, broadcast)
+
+
+def default_resolver() -> InterfaceResolver:
+    return _default
@@ -0,0 +1,178 @@
+import atexit
+import itertools
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Optional
+from my_utils import GameState, Hand
+
+'''append-only round journal - every round the server plays becomes one fixed-size binary record.
+the game loops only pack a record and hand it to a queue, a background thread appends the queued
+records in batches. a sidecar file gets one record per finished session (client name, time span),
+which is the index journal_query.py uses to find a session's rounds by time'''
+
+# session id, time, round number, GameState value, player total, dealer total, flags,
+# player card ids, dealer card ids (each padded with NO_CARD)
+RECORD = struct.Struct("<QdIBBBB12s12s")
+# session id, start time, end time, rounds, client name
+SESSION = struct.Struct("<QddI32s4x")
+MAX_CARDS = 12
+NO_CARD = 0xFF
+FLAG_STOOD = 0x1  # the player stood (otherwise they busted)
+FLAG_BULK = 0x2   # played in bulk mode
+
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds
+DEFAULT_BATCH_SIZE = 4096     # records per write
+
+
+def sessions_path(path: str) -> str:
+    return path + ".sessions"
+
+
+def _pack_cards(hand: Hand) -> bytes:
+    return bytes(card.id & NO_CARD for card in hand).ljust(MAX_CARDS, b"\xff")
+
+
+class JournalWriter:
+    """Owns the journal files and the thread that appends the queued records to them"""
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.written = 0
+        self._rounds = queue.SimpleQueue()
+        self._sessions = queue.SimpleQueue()
+        self._file = open(path, "ab", buffering=0)
+        self._sessions_file = open(sessions_path(path), "ab", buffering=0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+
+    def append(self, record: bytes):
+        self._rounds.put(record)
+
+    def append_session(self, record: bytes):
+        self._sessions.put(record)
+
+    def _drain(self, q: queue.SimpleQueue, first: Optional[bytes] = None) -> list:
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_pending(self, first: Optional[bytes] = None):
+        batch = self._drain(self._rounds, first)
+        while batch:
+            self._file.write(b"".join(batch))
+            self.written += len(batch)
+            batch = self._drain(self._rounds) if len(batch) == self.batch_size else []
+        # sessions only go to the index once their rounds are in the journal
+        sessions = self._drain(self._sessions)
+        if sessions:
+            self._sessions_file.write(b"".join(sessions))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._rounds.get(timeout=self.flush_interval)
+            except queue.Empty:
+                first = None
+            self._write_pending(first)
+        self._write_pending()
+
+    def close(self):
+        """Write everything still queued and close the files"""
+        self._stop.set()
+        self._thread.join()
+        self._file.close()
+        self._sessions_file.close()
+
+
+class SessionJournal:
+    """The rounds of one session"""
+    __slots__ = ("writer", "session_id", "client_name", "start", "flags", "rounds")
+
+    def __init__(self, writer: JournalWriter, session_id: int, client_name: str, bulk: bool):
+        self.writer = writer
+        self.session_id = session_id
+        self.client_name = client_name
+        self.start = time.time()
+        self.flags = FLAG_BULK if bulk else 0
+        self.rounds = 0
+
+    def round(self, player_hand: Hand, dealer_hand: Hand, state: GameState):
+        self.rounds += 1
+        flags = self.flags if player_hand.busted else self.flags | FLAG_STOOD
+        self.writer.append(RECORD.pack(
+            self.session_id,
+            time.time(),
+            self.rounds,
+            state._value_,
+            player_hand.total,
+            dealer_hand.total,
+            flags,
+            _pack_cards(player_hand),
+            _pack_cards(dealer_hand),
+        ))
+
+    def close(self):
+        self.writer.append_session(SESSION.pack(
+            self.session_id,
+            self.start,
+            time.time(),
+            self.rounds,
+            self.client_name.encode()[:32],
+        ))
+
+
+class _NoJournal:
+    """Stand-in when journaling is off"""
+    __slots__ = ()
+
+    def round(self, player_hand: Hand, dealer_hand: Hand, state: GameState):
+        pass
+
+    def close(self):
+        pass
+
+
+_NO_JOURNAL = _NoJournal()
+_writer: Optional[JournalWriter] = None
+_session_seq = itertools.count(1)
+
+
+def configure(path: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+    """Start journaling every round to path (appending if it exists)"""
+    global _writer
+    shutdown()
+    _writer = JournalWriter(path, flush_interval)
+
+
+def shutdown():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+def session(client_name: str, bulk: bool = False):
+    """Journal for one session - does nothing if journaling is off"""
+    if _writer is None:
+        return _NO_JOURNAL
+    # unique across the worker processes writing their own journals
+    session_id = (os.getpid() << 32) | next(_session_seq)
+    return SessionJournal(_writer, session_id, client_name, bulk)
+
+
+atexit.register(shutdown)
@@ -0,0 +1,212 @@
+import argparse
+import json
+import mmap
+import os
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from my_utils import GameState
+from journal import RECORD, SESSION, NO_CARD, FLAG_BULK, sessions_path
+
+'''analytics over round journals - the journal files are memory mapped and viewed as numpy structured
+arrays, so millions of records are aggregated column by column without building a python object each.
+records are appended in time order, which makes a time range one binary search'''
+
+RECORD_DTYPE = np.dtype([
+    ("session", "<u8"),
+    ("time", "<f8"),
+    ("round", "<u4"),
+    ("result", "u1"),
+    ("player_total", "u1"),
+    ("dealer_total", "u1"),
+    ("flags", "u1"),
+    ("player_cards", "u1", 12),
+    ("dealer_cards", "u1", 12),
+])
+SESSION_DTYPE = np.dtype({
+    "names": ["session", "start", "end", "rounds", "client"],
+    "formats": ["<u8", "<f8", "<f8", "<u4", "S32"],
+    "offsets": [0, 8, 16, 24, 28],
+    "itemsize": SESSION.size,
+})
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+CHUNK = 1 << 20  # records aggregated at a time, bounds the temporary arrays
+UNKNOWN_CLIENT = "?"  # rounds of sessions that are not in the index (yet)
+
+
+def open_journal(path: str) -> np.ndarray:
+    """The journal as a read-only structured array over an mmap of the file (complete records only)"""
+    size = os.path.getsize(path)
+    count = size // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # the array keeps the mapping alive
+    return np.frombuffer(mapped, dtype=RECORD_DTYPE, count=count)
+
+
+def load_sessions(path: str) -> np.ndarray:
+    """The session index of a journal, sorted by session id"""
+    index = sessions_path(path)
+    if not os.path.exists(index):
+        return np.empty(0, dtype=SESSION_DTYPE)
+    with open(index, "rb") as f:
+        data = f.read()
+    sessions = np.frombuffer(data, dtype=SESSION_DTYPE, count=len(data) // SESSION_DTYPE.itemsize)
+    return np.sort(sessions, order="session")
+
+
+def time_slice(records: np.ndarray, since: Optional[float] = None, until: Optional[float] = None) -> np.ndarray:
+    """Records with since <= time < until, as a view (binary search on the time column)"""
+    times = records["time"]
+    start = 0 if since is None else int(np.searchsorted(times, since, side="left"))
+    end = len(records) if until is None else int(np.searchsorted(times, until, side="left"))
+    return records[start:end]
+
+
+def session_rounds(records: np.ndarray, sessions: np.ndarray, session_id: int) -> np.ndarray:
+    """All rounds of one session - the index narrows it to the session's time span first"""
+    i = int(np.searchsorted(sessions["session"], session_id))
+    if i < len(sessions) and sessions["session"][i] == session_id:
+        records = time_slice(records, sessions["start"][i], np.nextafter(sessions["end"][i], np.inf))
+    return records[records["session"] == session_id]
+
+
+def client_names(sessions: np.ndarray) -> list:
+    return [name.rstrip(b"\x00").decode(errors="replace") for name in sessions["client"]]
+
+
+class JournalStats:
+    """Counts accumulated over any number of journal files / chunks"""
+
+    def __init__(self):
+        self.results = np.zeros(4, dtype=np.int64)              # by GameState value
+        self.player_totals = np.zeros(32, dtype=np.int64)
+        self.dealer_totals = np.zeros(32, dtype=np.int64)
+        self.hits = np.zeros(16, dtype=np.int64)                # player hits per round
+        self.player_busts = 0
+        self.dealer_busts = 0
+        self.bulk_rounds = 0
+        self.clients: dict[str, np.ndarray] = {}                # client -> counts by GameState value
+
+    @property
+    def rounds(self) -> int:
+        return int(self.results.sum())
+
+    def add(self, records: np.ndarray, sessions: np.ndarray, client: Optional[str] = None):
+        names = np.array(client_names(sessions) + [UNKNOWN_CLIENT], dtype=object)
+        for start in range(0, len(records), CHUNK):
+            self._add_chunk(records[start:start + CHUNK], sessions, names, client)
+
+    def _add_chunk(self, chunk: np.ndarray, sessions: np.ndarray, names: np.ndarray, client: Optional[str]):
+        # which index entry every record belongs to (len(sessions) = not indexed)
+        owner = np.searchsorted(sessions["session"], chunk["session"])
+        owner = np.minimum(owner, len(sessions))
+        known = owner < len(sessions)
+        known[known] = sessions["session"][owner[known]] == chunk["session"][known]
+        owner[~known] = len(sessions)
+
+        if client is not None:
+            keep = np.isin(owner, np.flatnonzero(names == client))
+            chunk, owner = chunk[keep], owner[keep]
+
+        result = chunk["result"]
+        player = chunk["player_total"]
+        dealer = chunk["dealer_total"]
+        self.results += np.bincount(result, minlength=4)[:4]
+        self.player_totals += np.bincount(np.minimum(player, 31), minlength=32)
+        busted = player > 21
+        self.player_busts += int(busted.sum())
+        self.dealer_busts += int(((dealer > 21) & ~busted).sum())
+        self.dealer_totals += np.bincount(np.minimum(dealer[~busted], 31), minlength=32)
+        hits = (chunk["player_cards"] != NO_CARD).sum(axis=1) - 2
+        self.hits += np.bincount(np.clip(hits, 0, 15), minlength=16)
+        self.bulk_rounds += int((chunk["flags"] & FLAG_BULK != 0).sum())
+
+        per_owner = np.bincount(owner * 4 + result, minlength=(len(names)) * 4).reshape(-1, 4)
+        for i in np.flatnonzero(per_owner.sum(axis=1)):
+            name = names[i]
+            self.clients[name] = self.clients.get(name, np.zeros(4, dtype=np.int64)) + per_owner[i]
+
+    def rate(self, state: GameState) -> float:
+        return float(self.results[state.value]) / self.rounds if self.rounds else 0.0
+
+    def summary(self) -> dict:
+        rounds = self.rounds
+        played_out = rounds - self.player_busts
+        return {
+            "rounds": rounds,
+            "bulk_rounds": self.bulk_rounds,
+            "win_rate": self.rate(GameState.WIN),
+            "loss_rate": self.rate(GameState.LOSS),
+            "tie_rate": self.rate(GameState.TIE),
+            "player_bust_rate": self.player_busts / rounds if rounds else 0.0,
+            "dealer_bust_rate": self.dealer_busts / played_out if played_out else 0.0,
+            "player_totals": {t: int(n) for t, n in enumerate(self.player_totals) if n},
+            "dealer_totals": {t: int(n) for t, n in enumerate(self.dealer_totals) if n},
+            "hits_per_round": {h: int(n) for h, n in enumerate(self.hits) if n},
+            "clients": {
+                name: {
+                    "rounds": int(counts.sum()),
+                    "wins": int(counts[GameState.WIN.value]),
+                    "losses": int(counts[GameState.LOSS.value]),
+                    "ties": int(counts[GameState.TIE.value]),
+                    "win_rate": float(counts[GameState.WIN.value]) / counts.sum(),
+                }
+                for name, counts in sorted(self.clients.items())
+            },
+        }
+
+
+def _parse_time(value: str) -> float:
+    """Epoch seconds or an ISO date / datetime"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def print_summary(summary: dict):
+    print(f"[JOURNAL] Rounds: {summary['rounds']} ({summary['bulk_rounds']} in bulk mode)")
+    print(f"[JOURNAL] Win / loss / tie: {summary['win_rate']:.4f} / {summary['loss_rate']:.4f} / "
+          f"{summary['tie_rate']:.4f}")
+    print(f"[JOURNAL] Player bust rate: {summary['player_bust_rate']:.4f}, "
+          f"dealer bust rate: {summary['dealer_bust_rate']:.4f}")
+    for key, label in (("player_totals", "Player totals"), ("dealer_totals", "Dealer totals"),
+                       ("hits_per_round", "Hits per round")):
+        counts = summary[key]
+        print(f"[JOURNAL] {label}: " + " ".join(f"{k}:{v}" for k, v in counts.items()))
+    for name, client in summary["clients"].items():
+        print(f"[JOURNAL] Client {name!r}: {client['rounds']} rounds, win rate {client['win_rate']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query round journals written by server.py --journal")
+    parser.add_argument("paths", nargs="+", help="journal files (with --workers, one per worker)")
+    parser.add_argument("--since", type=_parse_time, default=None, help="epoch seconds or ISO date/time")
+    parser.add_argument("--until", type=_parse_time, default=None)
+    parser.add_argument("--client", default=None, help="only rounds of this client name")
+    parser.add_argument("--session", type=int, default=None, help="only rounds of this session id")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    stats = JournalStats()
+    for path in args.paths:
+        records = open_journal(path)
+        sessions = load_sessions(path)
+        if args.session is not None:
+            records = session_rounds(records, sessions, args.session)
+        records = time_slice(records, args.since, args.until)
+        stats.add(records, sessions, args.client)
+
+    summary = stats.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
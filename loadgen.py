@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Optional
+from pack_manager import (
+    pack_request,
+    pack_client_payload,
+    unpack_server_payload,
+    pack_bulk_request,
+    unpack_bulk_header,
+    ServerBusyError,
+)
+from my_utils import MessageLength, GameState, PlayerDecision, BULK_RECORD_LENGTH, MAX_BULK_ROUNDS
+from strategy import strategy_table, stand_on_table, MAX_TOTAL, MAX_UPCARD
+from udp import listen_for_offers
+
+'''headless load generator - opens many simulated clients against a server, each playing N rounds
+with a scripted policy, and reports throughput, connection setup time and decision latency'''
+
+CLIENT_NAME = "loadgen"  # simulated client i plays its sessions as loadgen-<i>-<session>
+MAX_ROUNDS = 255  # num rounds is one byte in the REQUEST message
+
+
+def threshold_strategy(stand_on: int) -> bytes:
+    """Strategy table (same layout as strategy.strategy_table) that hits below stand_on"""
+    table = bytearray(MAX_TOTAL * MAX_UPCARD)
+    for total in range(min(stand_on, MAX_TOTAL)):
+        for upcard in range(MAX_UPCARD):
+            table[total * MAX_UPCARD + upcard] = 1
+    return bytes(table)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadStats:
+    """Everything measured during a run, shared by all simulated clients"""
+
+    def __init__(self):
+        self.connect_times: list[float] = []
+        self.decision_latencies: list[float] = []
+        self.results = {state: 0 for state in (GameState.WIN, GameState.LOSS, GameState.TIE)}
+        self.sessions = 0
+        self.errors = 0
+        self.busy = 0  # sessions the server turned away as full
+
+    @property
+    def rounds(self) -> int:
+        return sum(self.results.values())
+
+    def summary(self, elapsed: float) -> dict:
+        connect = sorted(self.connect_times)
+        latency = sorted(self.decision_latencies)
+        return {
+            "elapsed_s": elapsed,
+            "sessions": self.sessions,
+            "errors": self.errors,
+            "busy": self.busy,
+            "rounds": self.rounds,
+            "rounds_per_s": self.rounds / elapsed if elapsed else 0.0,
+            "decisions": len(latency),
+            "wins": self.results[GameState.WIN],
+            "losses": self.results[GameState.LOSS],
+            "ties": self.results[GameState.TIE],
+            "connect_ms": {f"p{p}": percentile(connect, p) * 1000 for p in (50, 95, 99)},
+            "decision_ms": {f"p{p}": percentile(latency, p) * 1000 for p in (50, 95, 99)},
+        }
+
+
+async def read_payload(reader: asyncio.StreamReader):
+    return unpack_server_payload(await reader.readexactly(MessageLength.SERVER_PAYLOAD.value))
+
+
+async def run_session(host: str, port: int, client_name: str, num_rounds: int, strategy: bytes, stats: LoadStats):
+    """One simulated client session: connect, send the request, play every round"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    stats.connect_times.append(time.perf_counter() - start)
+
+    try:
+        writer.write(pack_request(num_rounds, client_name))
+        for _ in range(num_rounds):
+            player_total = 0
+            for i in range(3):
+                card, state = await read_payload(reader)
+                if i < 2:
+                    player_total += card.value()
+                else:
+                    upcard = card.value()
+
+            if player_total > 21:
+                # two aces - the server ends the round without asking
+                card, state = await read_payload(reader)
+                stats.results[state] += 1
+                continue
+
+            while True:
+                hit = player_total < MAX_TOTAL and strategy[player_total * MAX_UPCARD + upcard]
+                decision = PlayerDecision.HIT if hit else PlayerDecision.STAND
+                sent = time.perf_counter()
+                writer.write(pack_client_payload(decision))
+                card, state = await read_payload(reader)
+                stats.decision_latencies.append(time.perf_counter() - sent)
+
+                if decision == PlayerDecision.HIT:
+                    player_total += card.value()
+                    if state == GameState.NOT_OVER:
+                        continue
+                else:
+                    # dealer cards until the result arrives
+                    while state == GameState.NOT_OVER:
+                        card, state = await read_payload(reader)
+                stats.results[state] += 1
+                break
+        stats.sessions += 1
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def run_bulk_session(host: str, port: int, client_name: str, num_rounds: int, stand_on: bytes,
+                           stats: LoadStats):
+    """One bulk session: send the policy with the request, then only read result batches"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    stats.connect_times.append(time.perf_counter() - start)
+
+    try:
+        writer.write(pack_bulk_request(num_rounds, client_name, stand_on))
+        received = 0
+        while received < num_rounds:
+            num_records = unpack_bulk_header(await reader.readexactly(MessageLength.BULK_RESULTS.value))
+            states = (await reader.readexactly(num_records * BULK_RECORD_LENGTH))[::BULK_RECORD_LENGTH]
+            for state in stats.results:
+                stats.results[state] += states.count(state.value)
+            received += num_records
+        stats.sessions += 1
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def run_client(host: str, port: int, client_name: str, sessions: int, num_rounds: int, strategy: bytes,
+                     stats: LoadStats, bulk: bool = False):
+    """
+    One simulated client playing several sessions back to back.
+    Every session sends its own name, so a seeded server deals each one different cards.
+    """
+    for session in range(sessions):
+        session_name = f"{client_name}-{session}"
+        try:
+            if bulk:
+                await run_bulk_session(host, port, session_name, num_rounds, stand_on_table(strategy), stats)
+            else:
+                await run_session(host, port, session_name, num_rounds, strategy, stats)
+        except ServerBusyError:
+            stats.busy += 1
+        except (ConnectionError, OSError, ValueError, asyncio.IncompleteReadError) as e:
+            stats.errors += 1
+            print(f"[LOADGEN] Session error: {e!r}")
+
+
+async def run_load(
+    host: str,
+    port: int,
+    clients: int,
+    sessions: int,
+    num_rounds: int,
+    strategy: bytes,
+    bulk: bool = False,
+) -> dict:
+    """Run all simulated clients at once, returns the summary"""
+    stats = LoadStats()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(host, port, f"{CLIENT_NAME}-{i}", sessions, num_rounds, strategy, stats, bulk)
+        for i in range(clients)
+    ))
+    return stats.summary(time.perf_counter() - start)
+
+
+def print_summary(summary: dict):
+    print(f"[LOADGEN] Sessions: {summary['sessions']} ({summary['errors']} errors, {summary['busy']} busy) in {summary['elapsed_s']:.2f}s")
+    print(f"[LOADGEN] Rounds: {summary['rounds']} ({summary['rounds_per_s']:.1f} rounds/s), "
+          f"decisions: {summary['decisions']}")
+    print(f"[LOADGEN] W/L/T: {summary['wins']}/{summary['losses']}/{summary['ties']}")
+    for key, label in (("connect_ms", "Connect"), ("decision_ms", "Decision latency")):
+        pcts = summary[key]
+        print(f"[LOADGEN] {label} ms: p50={pcts['p50']:.3f} p95={pcts['p95']:.3f} p99={pcts['p99']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the blackjack server")
+    parser.add_argument("--host", default=None, help="connect directly, skipping UDP discovery")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--clients", type=int, default=100, help="concurrent simulated clients")
+    parser.add_argument("--sessions", type=int, default=1, help="sessions per client, played back to back")
+    parser.add_argument("--rounds", type=int, default=100,
+                        help=f"rounds per session (max {MAX_ROUNDS}, {MAX_BULK_ROUNDS} with --bulk)")
+    parser.add_argument("--stand-on", type=int, default=None,
+                        help="hit below this total instead of the optimal strategy")
+    parser.add_argument("--bulk", action="store_true",
+                        help="send the policy once per session and let the server play the rounds")
+    parser.add_argument("--json", default=None, metavar="PATH", help="also write the summary as JSON")
+    args = parser.parse_args()
+
+    max_rounds = MAX_BULK_ROUNDS if args.bulk else MAX_ROUNDS
+    if not 1 <= args.rounds <= max_rounds:
+        parser.error(f"--rounds must be between 1 and {max_rounds}")
+
+    host: Optional[str] = args.host
+    port: Optional[int] = args.port
+    if host is None or port is None:
+        print("[LOADGEN] Listening for server offers...")
+        host, port, server_name = listen_for_offers(timeout=5.0)
+        print(f"[LOADGEN] Found {server_name} at {host}:{port}")
+
+    strategy = strategy_table() if args.stand_on is None else threshold_strategy(args.stand_on)
+    summary = asyncio.run(run_load(host, port, args.clients, args.sessions, args.rounds, strategy, args.bulk))
+    summary.update(host=host, port=port, clients=args.clients, rounds_per_session=args.rounds, bulk=args.bulk)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Optional
+
+'''buffered, leveled logging for the game loops.
+records are formatted only if they will actually be emitted, then handed to a bounded queue;
+a background thread does the console / file writes, so the game loop never blocks on I/O.
+when the queue is full, records are dropped (and counted) instead of waiting'''
+
+DEFAULT_QUEUE_SIZE = 10_000
+ROOT_LOGGER = "blackjack"
+
+_config = {
+    "level": logging.INFO,
+    "log_file": None,
+    "queue_size": DEFAULT_QUEUE_SIZE,
+    "sample_rate": 1.0,
+}
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["_DroppingQueueHandler"] = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks - a full queue drops the record"""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # the queue may be full at shutdown - wait for room instead of failing
+        self.queue.put(self._sentinel)
+
+
+class SessionLogger(logging.LoggerAdapter):
+    """
+    Per-session logger. Only a sampled fraction of sessions emit records below WARNING,
+    the rest skip them before any formatting happens.
+    """
+
+    def __init__(self, logger: logging.Logger, sampled: bool):
+        super().__init__(logger, {})
+        self.sampled = sampled
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.WARNING and not self.sampled:
+            return False
+        return self.logger.isEnabledFor(level)
+
+
+def _start():
+    """(Re)build the queue, the queue handler and the writer thread from _config"""
+    global _listener, _handler
+    root = logging.getLogger(ROOT_LOGGER)
+    if _handler is not None:
+        root.removeHandler(_handler)
+
+    q = queue.Queue(maxsize=_config["queue_size"])
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if _config["log_file"]:
+        file_handler = logging.FileHandler(_config["log_file"])
+        file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        handlers.append(file_handler)
+
+    _handler = _DroppingQueueHandler(q)
+    root.addHandler(_handler)
+    root.setLevel(_config["level"])
+    root.propagate = False
+    _listener = _Listener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def configure(
+    level: int = logging.INFO,
+    log_file: Optional[str] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    sample_rate: float = 1.0,
+):
+    """Set up logging, sample_rate is the fraction of sessions whose debug/info records are kept"""
+    _config.update(level=level, log_file=log_file, queue_size=queue_size, sample_rate=sample_rate)
+    if _listener is not None:
+        _listener.stop()
+    _start()
+
+
+def _ensure_started():
+    if _listener is None:
+        _start()
+
+
+def _restart_after_fork():
+    # the writer thread does not survive fork - give the child process its own
+    global _listener
+    if _listener is not None:
+        _listener = None
+        _start()
+
+
+def flush():
+    """Wait until every queued record has been written (e.g. before prompting for input)"""
+    if _listener is not None:
+        _listener.queue.join()
+
+
+def shutdown():
+    """Write out what is left in the queue and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None and _handler.dropped:
+        print(f"[LOG] {_handler.dropped} log records dropped (queue full)", file=sys.stderr)
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the buffered 'blackjack' root"""
+    _ensure_started()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def session_logger(logger: logging.Logger) -> SessionLogger:
+    """Logger for one session, sampled with the configured sample rate"""
+    rate = _config["sample_rate"]
+    return SessionLogger(logger, rate >= 1.0 or random.random() < rate)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(shutdown)
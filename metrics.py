@@ -0,0 +1,193 @@
+import socket
+import threading
+from bisect import bisect_left
+from typing import Optional
+
+'''low overhead server instrumentation - counters and fixed-bucket latency histograms per phase,
+served as Prometheus text over a loopback TCP port.
+recording is a couple of list / int updates, so it stays on in the hot paths all the time'''
+
+PREFIX = "blackjack"
+# seconds - covers loopback round trips up to slow humans
+PHASE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SESSION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+
+
+class Counter:
+    """Monotonic counter"""
+    __slots__ = ("name", "help", "value")
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+
+class Histogram:
+    """Fixed-bucket histogram, counts are kept per bucket and made cumulative only when rendered"""
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple = PHASE_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+# ---- the registry ----
+_counters: list[Counter] = []
+_phases: dict[str, Histogram] = {}
+_timeouts: dict[str, Counter] = {}
+
+
+def counter(name: str, help: str) -> Counter:
+    c = Counter(name, help)
+    _counters.append(c)
+    return c
+
+
+def phase(name: str) -> Histogram:
+    hist = _phases[name] = Histogram()
+    return hist
+
+
+def timeout(reason: str) -> Counter:
+    c = _timeouts[reason] = Counter(reason, "")
+    return c
+
+
+ACCEPTED = counter("connections_accepted_total", "TCP connections accepted")
+BUSY = counter("busy_rejections_total", "Connections turned away because the server was full")
+SESSIONS = counter("sessions_total", "Finished sessions")
+SESSION_ERRORS = counter("session_errors_total", "Sessions that ended with a client error")
+ROUNDS = counter("rounds_total", "Rounds played")
+DECISIONS = counter("decisions_total", "Player decisions received")
+TABLE_ROUNDS = counter("table_rounds_total", "Rounds dealt at multi-player tables, one dealer hand each")
+TURN_TIMEOUTS = counter("turn_timeouts_total", "Table seats stood for missing a turn deadline")
+
+REQUEST = phase("request")    # connection accepted -> request parsed
+DECISION = phase("decision")  # payloads flushed -> decision received (client think time + round trip)
+DEALER = phase("dealer")      # dealer play and result of one round
+WRITE = phase("write")        # handing a batch of payloads to the socket
+RECV = phase("recv")          # blocking receives in safe_recv / FrameReader
+SESSION = Histogram(SESSION_BUCKETS)
+
+# sessions torn down for missing a deadline, by the deadline they missed
+REQUEST_TIMEOUTS = timeout("request")
+DECISION_TIMEOUTS = timeout("decision")
+SESSION_TIMEOUTS = timeout("session")
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _render_histogram(lines: list, name: str, hist: Histogram, labels: dict):
+    prefix = _labels(labels)
+    prefix = prefix + "," if prefix else ""
+    cumulative = 0
+    for bound, count in zip(hist.bounds, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    cumulative += hist.counts[-1]
+    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+    suffix = f"{{{_labels(labels)}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {hist.sum}")
+    lines.append(f"{name}_count{suffix} {cumulative}")
+
+
+def render(labels: Optional[dict] = None) -> str:
+    """Everything recorded so far, in the Prometheus text exposition format"""
+    labels = labels or {}
+    suffix = f"{{{_labels(labels)}}}" if labels else ""
+    lines = []
+    for c in _counters:
+        name = f"{PREFIX}_{c.name}"
+        lines.append(f"# HELP {name} {c.help}")
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{suffix} {c.value}")
+
+    name = f"{PREFIX}_timeouts_total"
+    lines.append(f"# HELP {name} Sessions torn down for missing a deadline")
+    lines.append(f"# TYPE {name} counter")
+    for reason, c in _timeouts.items():
+        lines.append(f"{name}{{{_labels({**labels, 'reason': reason})}}} {c.value}")
+
+    name = f"{PREFIX}_phase_seconds"
+    lines.append(f"# HELP {name} Time spent per session phase")
+    lines.append(f"# TYPE {name} histogram")
+    for phase_name, hist in _phases.items():
+        _render_histogram(lines, name, hist, {**labels, "phase": phase_name})
+
+    name = f"{PREFIX}_session_seconds"
+    lines.append(f"# HELP {name} Session duration")
+    lines.append(f"# TYPE {name} histogram")
+    _render_histogram(lines, name, SESSION, labels)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Answers every connection on a loopback TCP port with the current metrics as a minimal
+    HTTP/1.0 response, so both `curl` and a Prometheus scrape work.
+    Runs on its own thread, the game loops never wait for it.
+    """
+
+    def __init__(self, port: int, labels: Optional[dict] = None):
+        self.labels = labels
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", port))
+        self._sock.listen(8)
+        self._sock.settimeout(0.5)
+        self.port = self._sock.getsockname()[1]
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _serve_one(self, conn: socket.socket):
+        conn.settimeout(1.0)
+        try:
+            conn.recv(4096)  # the request itself does not matter
+            body = render(self.labels).encode()
+            conn.sendall(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._serve_one(conn)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._sock.close()
@@ -0,0 +1,205 @@
+import argparse
+import gc
+import itertools
+import json
+import platform
+import random
+import time
+import tracemalloc
+from functools import partial
+from typing import Callable, Optional
+from pack_manager import pack_server_payload, pack_client_payload, unpack_client_payload
+from my_utils import CARDS, GameState, PlayerDecision, Suits, Hand, Card, pack_card, unpack_card, fix_name_length
+from game import BlackjackGame, Shoe
+from strategy import strategy_table, MAX_UPCARD
+
+'''microbenchmarks for the inner loops - codec, card representation and game engine.
+every benchmark times one operation in isolation (best of several runs, gc off like timeit)
+and counts its allocations with tracemalloc: the blocks / bytes an operation leaves behind
+(its result, anything it caches) and the peak of the temporaries it makes on the way.
+results can be saved as JSON and compared against a saved baseline'''
+
+DEFAULT_MIN_TIME = 0.2  # seconds per timed run
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10  # a benchmark regressed if its ops/s dropped by more than this fraction
+ALLOC_OPS = 1000  # operations traced for the allocation counts
+CALIBRATE_TIME = 0.02  # seconds a calibration run has to take
+ALLOC_TOLERANCE = 0.5  # more blocks left behind per op than the baseline by this much is a regression
+
+
+def _optimal_decision() -> Callable[[Hand, Card], PlayerDecision]:
+    table = strategy_table()
+
+    def decide(player_hand: Hand, dealer_card: Card) -> PlayerDecision:
+        if table[min(player_hand.total, 31) * MAX_UPCARD + dealer_card.value()]:
+            return PlayerDecision.HIT
+        return PlayerDecision.STAND
+
+    return decide
+
+
+# ---- the benchmarks: name -> setup() returning the operation, a callable without arguments ----
+
+def _deck_game() -> BlackjackGame:
+    random.seed(0)
+    return BlackjackGame()
+
+
+BENCHMARKS: dict[str, Callable[[], Callable]] = {
+    "pack_server_payload": lambda: partial(pack_server_payload, CARDS[17], GameState.NOT_OVER),
+    "unpack_client_payload": lambda: partial(unpack_client_payload, pack_client_payload(PlayerDecision.HIT)),
+    "unpack_card": lambda: partial(unpack_card, pack_card(12, Suits.SPADE.value)),
+    "fix_name_length": lambda: partial(fix_name_length, "benchmark client"),
+    "card_value": lambda: CARDS[17].value,
+    "card_str": lambda: CARDS[17].__str__,
+    "new_shuffled_deck": lambda: _deck_game()._new_shuffled_deck,
+    "draw_card_deck": lambda: _deck_game().draw_card,
+    "draw_card_shoe": lambda: BlackjackGame(Shoe(seed=0)).draw_card,
+    "play_round": lambda: partial(BlackjackGame(Shoe(seed=0)).play_round, _optimal_decision()),
+}
+
+
+def _time_loop(op: Callable, n: int) -> float:
+    loop = itertools.repeat(None, n)
+    start = time.perf_counter()
+    for _ in loop:
+        op()
+    return time.perf_counter() - start
+
+
+def measure_time(op: Callable, min_time: float = DEFAULT_MIN_TIME, repeat: int = DEFAULT_REPEAT) -> float:
+    """Best seconds per operation over repeat runs of about min_time each"""
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        n = 1
+        while True:
+            elapsed = _time_loop(op, n)
+            if elapsed >= CALIBRATE_TIME:
+                break
+            n *= 10 if elapsed < CALIBRATE_TIME / 10 else 2
+        n = max(1, int(n * min_time / elapsed))
+        return min(_time_loop(op, n) for _ in range(repeat)) / n
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def measure_allocations(op: Callable, n: int = ALLOC_OPS) -> tuple[float, float, float]:
+    """(blocks, bytes) left behind and peak bytes of temporaries, per operation"""
+    results = [None] * n  # keeps every result alive, so it shows up in the diff
+    op()  # warm up lazily built caches
+    exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(exclude)
+        for i in range(n):
+            results[i] = op()
+        after = tracemalloc.take_snapshot().filter_traces(exclude)
+        peaks = 0
+        for _ in range(n):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            op()
+            peaks += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in diff)
+    size = sum(stat.size_diff for stat in diff)
+    return max(blocks, 0) / n, max(size, 0) / n, peaks / n
+
+
+def run_benchmarks(
+    names: list,
+    min_time: float = DEFAULT_MIN_TIME,
+    repeat: int = DEFAULT_REPEAT,
+    on_result: Optional[Callable[[str, dict], None]] = None,
+) -> dict:
+    results = {}
+    for name in names:
+        setup = BENCHMARKS[name]
+        seconds = measure_time(setup(), min_time, repeat)
+        blocks, size, peak = measure_allocations(setup())
+        results[name] = {
+            "ns_per_op": seconds * 1e9,
+            "ops_per_s": 1.0 / seconds,
+            "allocs_per_op": blocks,
+            "bytes_per_op": size,
+            "peak_bytes_per_op": peak,
+        }
+        if on_result is not None:
+            on_result(name, results[name])
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    [(name, ops/s ratio, allocs per op before, after, regressed)] for every benchmark in both.
+    Slower by more than threshold, or leaving ALLOC_TOLERANCE blocks more behind per op, is a regression.
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["ops_per_s"] / base["ops_per_s"]
+        allocs_up = result["allocs_per_op"] - base["allocs_per_op"] >= ALLOC_TOLERANCE
+        rows.append((name, ratio, base["allocs_per_op"], result["allocs_per_op"],
+                     ratio < 1.0 - threshold or allocs_up))
+    return rows
+
+
+def print_result(name: str, result: dict):
+    print(f"[BENCH] {name:<22} {result['ns_per_op']:>10.1f} ns/op {result['ops_per_s']:>14,.0f} ops/s "
+          f"{result['allocs_per_op']:>7.2f} allocs/op {result['bytes_per_op']:>8.1f} B/op "
+          f"{result['peak_bytes_per_op']:>8.1f} peak B/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the codec, card and game hot paths")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="seconds per timed run")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs, the best one counts")
+    parser.add_argument("--save", default=None, metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, metavar="PATH", help="compare against results saved earlier")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fraction of ops/s a benchmark may lose against the baseline")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = run_benchmarks(args.names or list(BENCHMARKS), args.min_time, args.repeat, print_result)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+                "time": time.time(),
+                "results": results,
+            }, f, indent=2)
+        print(f"[BENCH] Results written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("python") != platform.python_version():
+            print(f"[BENCH] Baseline is from Python {baseline.get('python')}, the numbers may not compare")
+        regressions = 0
+        for name, ratio, allocs_before, allocs_after, regressed in compare(results, baseline["results"],
+                                                                           args.threshold):
+            regressions += regressed
+            print(f"[BENCH] {name:<22} {ratio - 1:>+8.1%} ops/s, allocs/op {allocs_before:.2f} -> "
+                  f"{allocs_after:.2f}{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f"[BENCH] {regressions} regressions beyond {args.threshold:.0%}")
+            raise SystemExit(1)
+        print(f"[BENCH] No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,16 @@ import struct
 MAGIC_COOKIE = 0xabcddcba
 BROADCAST_UDP_PORT = 13122
 DEFAULT_TCP_PORT = 0
+DEFAULT_MAX_SESSIONS = 1024  # concurrent sessions per async server process
+BUSY_RETRY_MS = 500  # how long a turned away client is told to wait
+DEFAULT_TURN_TIMEOUT = 10.0  # seconds a table seat gets for each decision
+DEFAULT_REQUEST_TIMEOUT = 10.0  # seconds from connecting to a complete request
+DEFAULT_DECISION_TIMEOUT = 120.0  # seconds a (possibly human) player gets for each decision
+DEFAULT_SESSION_TIMEOUT = 3600.0  # seconds a whole session may last
 NAME_LENGTH = 32
+POLICY_LENGTH = 12        # bulk policy: stand-on total per dealer upcard value 0..11
+BULK_RECORD_LENGTH = 3    # bulk result per round: state + player total + dealer total
+MAX_BULK_ROUNDS = 10_000_000
 
 '''represents the player decisions during the game'''
 class PlayerDecision(Enum):
@@ -16,6 +25,9 @@ class MessageType(Enum):
     OFFER = 0x2
     REQUEST = 0x3
     RESPONSE = 0x4
+    BUSY = 0x5       # server is full, try again later
+    BULK_REQUEST = 0x6  # request + decision policy, the server plays every round by itself
+    BULK_RESULTS = 0x7  # a batch of per-round results for a bulk request
 
 '''represents the state of the game'''
 class GameState(Enum):
@@ -36,6 +48,12 @@ class MessageFormat(Enum):
     REQUEST = "!IBB32s"     # magic cookie + type + num rounds + client name
     CLIENT_PAYLOAD = "!IB5s"   # magic cookie + type + player decision
     SERVER_PAYLOAD = "!IB3sB"  # magic cookie + type + card(3) + round result
+    # extended offer - the plain offer followed by the server load, old clients skip it (length differs)
+    OFFER_LOAD = "!IBH32sHH"   # magic cookie + type + tcp port + server name + active sessions + capacity
+    BUSY = "!IBHH"             # magic cookie + type + retry after (ms) + capacity, same size as a server payload
+    # bulk mode - starts like a request (magic + type at the same offsets), the server tells them apart by type
+    BULK_REQUEST = "!IBI32s12s"  # magic cookie + type + num rounds + client name + stand-on per upcard value
+    BULK_RESULTS = "!IBH"        # magic cookie + type + number of round records that follow
 
 '''represents the length of each message type'''
 class MessageLength(Enum):
@@ -43,6 +61,10 @@ class MessageLength(Enum):
     REQUEST = struct.calcsize(MessageFormat.REQUEST.value)
     CLIENT_PAYLOAD = struct.calcsize(MessageFormat.CLIENT_PAYLOAD.value)
     SERVER_PAYLOAD = struct.calcsize(MessageFormat.SERVER_PAYLOAD.value)
+    OFFER_LOAD = struct.calcsize(MessageFormat.OFFER_LOAD.value)
+    BUSY = struct.calcsize(MessageFormat.BUSY.value)
+    BULK_REQUEST = struct.calcsize(MessageFormat.BULK_REQUEST.value)
+    BULK_RESULTS = struct.calcsize(MessageFormat.BULK_RESULTS.value)
 
 def pack_card(rank: int, suit: int) -> bytes:
     """Pack a card into 3 bytes: 2 bytes rank, 1 byte suit"""
@@ -68,27 +90,116 @@ def is_number(s):
     except ValueError:
         return False
 
+# -------------------------
+# Compact card representation
+# -------------------------
+# every standard card is a small int 0..51 (suit * 13 + rank - 1), so a deck fits in a bytearray
+# and rank / suit / value / display string are plain table lookups
+NUM_CARDS = 52
+_RANK_STR = {1: "A", 11: "J", 12: "Q", 13: "K"}
+_SUIT_STR = {Suits.HEART: "♥", Suits.DIAMOND: "♦", Suits.CLUB: "♣", Suits.SPADE: "♠"}
+
+
+def _rank_value(rank: int):
+    """Blackjack value of a rank (Ace always counts as 11)"""
+    if 2 <= rank <= 10:
+        return rank
+    elif 11 <= rank <= 13:  # J,Q,K
+        return 10
+    elif rank == 1:  # Ace
+        return 11
+
+
+def card_id(rank: int, suit: Suits) -> int:
+    """Compact id of a standard card"""
+    return suit.value * 13 + rank - 1
+
+
+CARD_RANK = bytes(i % 13 + 1 for i in range(NUM_CARDS))
+CARD_SUIT = tuple(Suits(i // 13) for i in range(NUM_CARDS))
+CARD_VALUE = bytes(_rank_value(rank) for rank in CARD_RANK)
+CARD_STR = tuple(
+    f"{_RANK_STR.get(CARD_RANK[i], str(CARD_RANK[i]))}{_SUIT_STR[CARD_SUIT[i]]}" for i in range(NUM_CARDS)
+)
+
 '''encapsulate ranks and suits into a single card'''
 class Card:
-    def __init__(self, rank: int, suit: Suits):
-        self.rank = rank
-        self.suit = suit
+    """
+    Immutable card. The 52 standard cards are shared singletons (Card(rank, suit) returns the
+    same object every time), only cards outside the standard deck get a fresh instance.
+    """
+    __slots__ = ("rank", "suit", "id", "_value", "_str")
+
+    def __new__(cls, rank: int, suit: Suits):
+        if 1 <= rank <= 13 and cls is Card:
+            return CARDS[card_id(rank, suit)]
+        return cls._make(rank, suit, -1)
+
+    @classmethod
+    def _make(cls, rank: int, suit: Suits, cid: int) -> "Card":
+        card = object.__new__(cls)
+        object.__setattr__(card, "rank", rank)
+        object.__setattr__(card, "suit", suit)
+        object.__setattr__(card, "id", cid)  # -1 for cards outside the standard deck
+        if cid >= 0:
+            object.__setattr__(card, "_value", CARD_VALUE[cid])
+            object.__setattr__(card, "_str", CARD_STR[cid])
+        else:
+            object.__setattr__(card, "_value", _rank_value(rank))
+            object.__setattr__(card, "_str", f"{_RANK_STR.get(rank, str(rank))}{_SUIT_STR[suit]}")
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable")
 
     def __str__(self):
-        # Convert rank to nice string
-        rank_str = {1: "A", 11: "J", 12: "Q", 13: "K"}.get(self.rank, str(self.rank))
-        # Suit as a symbol
-        suit_str = {"HEART": "♥", "DIAMOND": "♦", "CLUB": "♣", "SPADE": "♠"}[self.suit.name]
-        return f"{rank_str}{suit_str}"
+        return self._str
 
     def __repr__(self):
-        return str(self)
+        return self._str
 
     def value(self):
         """Return the blackjack value of the card"""
-        if 2 <= self.rank <= 10:
-            return self.rank
-        elif 11 <= self.rank <= 13:  # J,Q,K
-            return 10
-        elif self.rank == 1:  # Ace
-            return 11
\ No newline at end of file
+        return self._value
+
+
+CARDS = tuple(Card._make(CARD_RANK[i], CARD_SUIT[i], i) for i in range(NUM_CARDS))
+
+
+'''a hand of cards with a running total'''
+class Hand:
+    """
+    Cards plus a running total, bust flag and card count, all updated in O(1) on append -
+    so nobody has to rescan the hand to know where it stands.
+    Iterates / indexes like the list of cards.
+    """
+    __slots__ = ("cards", "total", "count", "busted")
+
+    def __init__(self, cards=()):
+        self.cards: list[Card] = []
+        self.total = 0
+        self.count = 0
+        self.busted = False
+        for card in cards:
+            self.append(card)
+
+    def append(self, card: Card):
+        self.cards.append(card)
+        self.total += card.value()
+        self.count += 1
+        self.busted = self.total > 21
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+    def __str__(self):
+        return ", ".join(map(str, self.cards))
+
+    def __repr__(self):
+        return repr(self.cards)
@@ -1,19 +1,103 @@
 import socket
-from udp import broadcast_offer, listen_for_offers
+from time import perf_counter
+import metrics
+from udp import broadcast_offer, listen_for_offers, OfferAnnouncer
 from tcp import create_tcp_server, connect_to_tcp_server, accept_tcp_connection_with_timeout
-from pack_manager import pack_request, unpack_request, Card, pack_client_payload, pack_server_payload, unpack_client_payload, unpack_server_payload
+from pack_manager import pack_request, unpack_request, Card, pack_client_payload, pack_server_payload, unpack_client_payload, unpack_server_payload, pack_busy, ServerBusyError, pack_bulk_request, unpack_bulk_request, pack_bulk_header, unpack_bulk_header
 
 '''the purpose of this file is to provide basic connectivity utilities, and be an access point to all smaller network related file
 including my udp and tcp files'''
 # -------------------------
 # Utilities
 # -------------------------
-def safe_recv(sock: socket.socket, n_bytes: int) -> bytes:
+def safe_recv(sock: socket.socket, n_bytes: int) -> bytearray:
     """Receive exactly n_bytes from socket"""
-    data = b""
-    while len(data) < n_bytes:
-        chunk = sock.recv(n_bytes - len(data))
-        if not chunk:
+    start = perf_counter()
+    data = bytearray(n_bytes)
+    view = memoryview(data)
+    received = 0
+    while received < n_bytes:
+        got = sock.recv_into(view[received:])
+        if not got:
             raise ConnectionError("Socket closed")
-        data += chunk
+        received += got
+    metrics.RECV.observe(perf_counter() - start)
     return data
+
+
+class FrameReader:
+    """
+    Buffered receiver for fixed-size frames.
+    Reads into one preallocated bytearray with recv_into, pulling in as many queued frames
+    as the kernel has per syscall, and hands out memoryview slices of that buffer -
+    so no bytes object is built per frame.
+    A returned frame is only valid until the next read_frame call.
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = 4096):
+        self.sock = sock
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # first unread byte
+        self._end = 0    # end of received data
+        self.bytes_received = 0
+
+    def read_frame(self, n_bytes: int) -> memoryview:
+        """Receive exactly n_bytes, as a view into the internal buffer"""
+        if self._end - self._start < n_bytes:
+            self._fill(n_bytes)
+        start = self._start
+        self._start = start + n_bytes
+        return self._view[start:self._start]
+
+    def _fill(self, n_bytes: int):
+        """Block until at least n_bytes unread bytes are buffered"""
+        if n_bytes > len(self._buf):
+            raise ValueError("Frame larger than receive buffer")
+        available = self._end - self._start
+        if available == 0:
+            self._start = self._end = 0
+        elif self._start + n_bytes > len(self._buf):
+            # not enough room after the unread tail - move it to the front
+            self._buf[:available] = self._buf[self._start:self._end]
+            self._start, self._end = 0, available
+        start = perf_counter()
+        while self._end - self._start < n_bytes:
+            got = self.sock.recv_into(self._view[self._end:])
+            if not got:
+                raise ConnectionError("Socket closed")
+            self._end += got
+            self.bytes_received += got
+        metrics.RECV.observe(perf_counter() - start)
+
+
+class SessionWriter:
+    """
+    Per-session write buffer - collects the payloads due before the next client decision
+    and flushes them with one vectored write (sendmsg) instead of one sendall each.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._pending: list[bytes] = []
+
+    def write(self, payload: bytes):
+        """Queue a payload, nothing is sent until flush()"""
+        self._pending.append(payload)
+
+    def flush(self):
+        """Send everything queued so far"""
+        pending = self._pending
+        if not pending:
+            return
+        start = perf_counter()
+        if len(pending) == 1 or not hasattr(self.sock, "sendmsg"):
+            self.sock.sendall(b"".join(pending))
+        else:
+            sent = self.sock.sendmsg(pending)
+            total = sum(len(p) for p in pending)
+            if sent < total:
+                # partial vectored write - push the rest the simple way
+                self.sock.sendall(b"".join(pending)[sent:])
+        pending.clear()
+        metrics.WRITE.observe(perf_counter() - start)
@@ -2,24 +2,76 @@ import struct
 from typing import Tuple
 from my_utils import (
     MAGIC_COOKIE,
+    MAX_BULK_ROUNDS,
+    POLICY_LENGTH,
     MessageFormat,
     MessageLength,
     MessageType,
     PlayerDecision,
     GameState,
     Card,
+    CARDS,
     fix_name_length,
     pack_card,
     unpack_card,
 )
 
+# -------------------------
+# Precompiled codec
+# -------------------------
+# struct formats are parsed once here instead of on every call
+_REQUEST = struct.Struct(MessageFormat.REQUEST.value)
+_CLIENT_PAYLOAD = struct.Struct(MessageFormat.CLIENT_PAYLOAD.value)
+_SERVER_PAYLOAD = struct.Struct(MessageFormat.SERVER_PAYLOAD.value)
+_BUSY = struct.Struct(MessageFormat.BUSY.value)
+_BULK_REQUEST = struct.Struct(MessageFormat.BULK_REQUEST.value)
+_BULK_RESULTS = struct.Struct(MessageFormat.BULK_RESULTS.value)
+
+_NUM_STATES = len(GameState)
+
+
+def _build_server_payload(card: Card, state: GameState) -> bytes:
+    return _SERVER_PAYLOAD.pack(
+        MAGIC_COOKIE,
+        MessageType.RESPONSE.value,
+        pack_card(card.rank, card.suit.value),
+        state.value,
+    )
+
+
+# there are only 52 cards x 4 states, so every server payload is a constant -
+# encoding is an index into this table (card id * 4 + state), decoding is one dict hit on the raw bytes
+_SERVER_PAYLOADS: list[bytes] = [
+    _build_server_payload(card, state) for card in CARDS for state in GameState
+]
+_SERVER_PAYLOAD_DECODE: dict[bytes, Tuple[Card, GameState]] = {
+    _build_server_payload(card, state): (card, state) for card in CARDS for state in GameState
+}
+
+_CLIENT_PAYLOADS: dict[bytes, bytes] = {
+    decision.value: _CLIENT_PAYLOAD.pack(MAGIC_COOKIE, MessageType.RESPONSE.value, decision.value)
+    for decision in PlayerDecision
+}
+_CLIENT_PAYLOAD_DECODE: dict[bytes, PlayerDecision] = {
+    _CLIENT_PAYLOADS[decision.value]: decision for decision in PlayerDecision
+}
+
+
+class ServerBusyError(ConnectionError):
+    """The server turned the session away because it is full"""
+
+    def __init__(self, retry_after_ms: int, capacity: int):
+        super().__init__(f"Server busy (capacity {capacity}), retry in {retry_after_ms}ms")
+        self.retry_after_ms = retry_after_ms
+        self.capacity = capacity
+
+
 # -------------------------
 # Payload packing/unpacking
 # -------------------------
 def pack_request(num_rounds: int, client_name: str) -> bytes:
     """Pack TCP request message"""
-    return struct.pack(
-        MessageFormat.REQUEST.value,
+    return _REQUEST.pack(
         MAGIC_COOKIE,
         MessageType.REQUEST.value,
         num_rounds,
@@ -32,9 +84,7 @@ def unpack_request(data: bytes) -> Tuple[int, str]:
     if len(data) != MessageLength.REQUEST.value:
         raise ValueError("Invalid request length")
 
-    magic, msg_type, num_rounds, client_name_bytes = struct.unpack(
-        MessageFormat.REQUEST.value, data
-    )
+    magic, msg_type, num_rounds, client_name_bytes = _REQUEST.unpack(data)
 
     if magic != MAGIC_COOKIE or msg_type != MessageType.REQUEST.value:
         raise ValueError("Invalid request message")
@@ -44,34 +94,83 @@ def unpack_request(data: bytes) -> Tuple[int, str]:
 
 def pack_client_payload(decision: PlayerDecision) -> bytes:
     """Pack client decision payload"""
-    return struct.pack(
-        MessageFormat.CLIENT_PAYLOAD.value,
-        MAGIC_COOKIE,
-        MessageType.RESPONSE.value,
-        decision.value,
-    )
+    return _CLIENT_PAYLOADS[decision._value_]
 
 
 def pack_server_payload(card: Card, state: GameState) -> bytes:
     """Pack server payload with a card and round state"""
-    card_bytes = pack_card(card.rank, card.suit.value)
-    return struct.pack(
-        MessageFormat.SERVER_PAYLOAD.value,
+    cid = card.id
+    if cid >= 0:
+        return _SERVER_PAYLOADS[cid * _NUM_STATES + state._value_]
+    return _build_server_payload(card, state)
+
+
+def pack_busy(retry_after_ms: int, capacity: int) -> bytes:
+    """Pack the busy reply sent instead of the first server payload when the server is full"""
+    # capacity is 16 bits on the wire, like the load in the extended offer
+    return _BUSY.pack(MAGIC_COOKIE, MessageType.BUSY.value, retry_after_ms, min(capacity, 0xFFFF))
+
+
+def pack_bulk_request(num_rounds: int, client_name: str, stand_on: bytes) -> bytes:
+    """Pack a bulk request - stand_on[upcard value] is the total the player stands on"""
+    if len(stand_on) != POLICY_LENGTH:
+        raise ValueError(f"Bulk policy must have {POLICY_LENGTH} entries")
+    return _BULK_REQUEST.pack(
         MAGIC_COOKIE,
-        MessageType.RESPONSE.value,
-        card_bytes,
-        state.value,
+        MessageType.BULK_REQUEST.value,
+        num_rounds,
+        fix_name_length(client_name),
+        bytes(stand_on),
     )
 
 
+def unpack_bulk_request(data: bytes) -> Tuple[int, str, bytes]:
+    """Unpack a bulk request into (num rounds, client name, stand-on per upcard value)"""
+    if len(data) != MessageLength.BULK_REQUEST.value:
+        raise ValueError("Invalid bulk request length")
+
+    magic, msg_type, num_rounds, client_name_bytes, stand_on = _BULK_REQUEST.unpack(data)
+
+    if magic != MAGIC_COOKIE or msg_type != MessageType.BULK_REQUEST.value:
+        raise ValueError("Invalid bulk request message")
+    if num_rounds > MAX_BULK_ROUNDS:
+        raise ValueError("Too many rounds requested")
+
+    return num_rounds, client_name_bytes.rstrip(b'\x00').decode(), stand_on
+
+
+def pack_bulk_header(num_records: int) -> bytes:
+    """Header of a batch of bulk results, the records themselves follow as raw bytes"""
+    return _BULK_RESULTS.pack(MAGIC_COOKIE, MessageType.BULK_RESULTS.value, num_records)
+
+
+def unpack_bulk_header(data: bytes) -> int:
+    """Number of round records in the batch that follows"""
+    if len(data) != MessageLength.BULK_RESULTS.value:
+        raise ValueError("Invalid bulk results length")
+
+    magic, msg_type, num_records = _BULK_RESULTS.unpack(data)
+
+    if magic == MAGIC_COOKIE and msg_type == MessageType.BUSY.value:
+        # a busy reply is longer than this header, but its retry after field is already in it
+        raise ServerBusyError(num_records, 0)
+    if magic != MAGIC_COOKIE or msg_type != MessageType.BULK_RESULTS.value:
+        raise ValueError("Invalid bulk results message")
+
+    return num_records
+
+
 def unpack_client_payload(data: bytes) -> PlayerDecision:
     """Unpack client decision"""
+    decision = _CLIENT_PAYLOAD_DECODE.get(bytes(data))
+    if decision is not None:
+        return decision
+
+    # not one of the known payloads - find out what is wrong with it
     if len(data) != MessageLength.CLIENT_PAYLOAD.value:
         raise ValueError("Invalid client payload length")
 
-    magic, msg_type, decision_bytes = struct.unpack(
-        MessageFormat.CLIENT_PAYLOAD.value, data
-    )
+    magic, msg_type, decision_bytes = _CLIENT_PAYLOAD.unpack(data)
 
     if magic != MAGIC_COOKIE or msg_type != MessageType.RESPONSE.value:
         raise ValueError("Invalid client payload")
@@ -81,12 +180,19 @@ def unpack_client_payload(data: bytes) -> PlayerDecision:
 
 def unpack_server_payload(data: bytes) -> Tuple[Card, GameState]:
     """Unpack server payload"""
+    decoded = _SERVER_PAYLOAD_DECODE.get(bytes(data))
+    if decoded is not None:
+        return decoded
+
+    # not in the table (bad message, or a card outside the standard deck) - decode the slow way
     if len(data) != MessageLength.SERVER_PAYLOAD.value:
         raise ValueError("Invalid server payload length")
 
-    magic, msg_type, card_bytes, state = struct.unpack(
-        MessageFormat.SERVER_PAYLOAD.value, data
-    )
+    magic, msg_type, card_bytes, state = _SERVER_PAYLOAD.unpack(data)
+
+    if magic == MAGIC_COOKIE and msg_type == MessageType.BUSY.value:
+        _, _, retry_after_ms, capacity = _BUSY.unpack(data)
+        raise ServerBusyError(retry_after_ms, capacity)
 
     if magic != MAGIC_COOKIE or msg_type != MessageType.RESPONSE.value:
         raise ValueError("Invalid server payload")
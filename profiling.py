@@ -0,0 +1,125 @@
+import contextlib
+import contextvars
+import json
+import os
+import random
+import signal
+import time
+from typing import Optional
+
+'''opt-in profiling hooks - cProfile (and optionally tracemalloc) around a sampled fraction of sessions,
+plus an on-demand profile of the whole process toggled with SIGUSR1.
+results go to a directory as .pstats / .tracemalloc snapshot files with a .json of metadata next to them.
+with profiling off (the default) or for an unsampled session, the cost is one random() call,
+and cProfile / tracemalloc are only imported once a profile starts'''
+
+TRACEMALLOC_FRAMES = 10
+
+_config = {
+    "directory": None,
+    "sample_rate": 0.0,
+    "memory": True,
+}
+_NOT_PROFILED = contextlib.nullcontext()
+_active = False  # only one profiler can run at a time
+_seq = 0
+_process_profile: Optional["_Profile"] = None
+# the profile of the session running in this context - per task on the asyncio engine, where a
+# session profile covers the whole loop and the other sessions must not annotate it
+_session: contextvars.ContextVar[Optional["_Profile"]] = contextvars.ContextVar("profiled_session", default=None)
+
+
+class _Profile:
+    """One profile: cProfile plus an optional tracemalloc snapshot, written out on stop()"""
+
+    def __init__(self, kind: str, meta: dict):
+        import cProfile
+        self.kind = kind
+        self.meta = meta
+        self._profiler = cProfile.Profile()
+        self._own_tracemalloc = False
+
+    def start(self):
+        global _active
+        import tracemalloc
+        _active = True
+        if _config["memory"] and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._own_tracemalloc = True
+        self.meta["started"] = time.time()
+        self._start = time.perf_counter()
+        self._profiler.enable()
+
+    def stop(self) -> str:
+        """Stop profiling and write the result files, returns their common path prefix"""
+        global _active, _seq
+        import tracemalloc
+        self._profiler.disable()
+        self.meta["duration_s"] = time.perf_counter() - self._start
+        _seq += 1
+        prefix = os.path.join(_config["directory"], f"{self.kind}-{os.getpid()}-{_seq:05d}")
+        self.meta["pid"] = os.getpid()
+        self._profiler.dump_stats(prefix + ".pstats")
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.meta.update(traced_bytes=current, peak_traced_bytes=peak)
+            tracemalloc.take_snapshot().dump(prefix + ".tracemalloc")
+            if self._own_tracemalloc:
+                tracemalloc.stop()
+        with open(prefix + ".json", "w") as f:
+            json.dump(self.meta, f, indent=2)
+        _active = False
+        return prefix
+
+    def __enter__(self):
+        self.start()
+        self._token = _session.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _session.reset(self._token)
+        try:
+            self.stop()
+        except OSError as e:
+            print(f"[PROFILE] Could not write profile: {e}")
+        return False
+
+
+def configure(directory: str, sample_rate: float = 0.0, memory: bool = True):
+    """
+    Profile sample_rate of all sessions into directory (tracemalloc too, if memory),
+    and let SIGUSR1 start / stop a profile of the whole process.
+    """
+    os.makedirs(directory, exist_ok=True)
+    _config.update(directory=directory, sample_rate=sample_rate, memory=memory)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, _toggle_process_profile)
+
+
+def session_profile(client_ip: str, engine: str = "serial"):
+    """Context manager around one session - profiles it if it is sampled, otherwise does nothing"""
+    rate = _config["sample_rate"]
+    if not rate or _active or random.random() >= rate:
+        return _NOT_PROFILED
+    return _Profile("session", {"kind": "session", "client_ip": client_ip, "engine": engine})
+
+
+def annotate(**fields):
+    """Add fields to the metadata of the session being profiled, if it is this one - otherwise does nothing"""
+    profile = _session.get()
+    if profile is not None:
+        profile.meta.update(fields)
+
+
+def _toggle_process_profile(signum, frame):
+    global _process_profile
+    if _process_profile is not None:
+        prefix = _process_profile.stop()
+        _process_profile = None
+        print(f"[PROFILE] Process profile written to {prefix}.*")
+    elif _active:
+        print("[PROFILE] A session is being profiled, try again in a moment")
+    else:
+        _process_profile = _Profile("process", {"kind": "process"})
+        _process_profile.start()
+        print(f"[PROFILE] Profiling process {os.getpid()}, send SIGUSR1 again to stop")
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import Optional
+import capture
+from capture import FROM_CLIENT
+from udp import listen_for_offers
+
+'''replays sessions recorded with server.py --capture against a server started with the same --seed.
+every session sends its recorded client frames (right after the replies before them, or at the
+original pace) and checks that each server frame comes back byte for byte'''
+
+MISMATCH_CONTEXT = 16  # bytes shown around the first difference
+
+
+class ReplayStats:
+    """Shared by all replayed sessions"""
+
+    def __init__(self):
+        self.sessions = 0
+        self.mismatches = 0
+        self.errors = 0
+        self.frames = 0
+        self.bytes = 0
+        self.first_mismatch: Optional[str] = None
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            "elapsed_s": elapsed,
+            "sessions": self.sessions,
+            "mismatches": self.mismatches,
+            "errors": self.errors,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "sessions_per_s": self.sessions / elapsed if elapsed else 0.0,
+            "frames_per_s": self.frames / elapsed if elapsed else 0.0,
+            "first_mismatch": self.first_mismatch,
+        }
+
+
+def _describe_mismatch(name: str, index: int, expected: bytes, got: bytes) -> str:
+    at = next((i for i, (a, b) in enumerate(zip(expected, got)) if a != b), min(len(expected), len(got)))
+    lo = max(0, at - MISMATCH_CONTEXT)
+    return (f"{name}: frame {index} differs at byte {at}: "
+            f"expected {expected[lo:at + MISMATCH_CONTEXT].hex()} got {got[lo:at + MISMATCH_CONTEXT].hex()}")
+
+
+async def replay_session(host: str, port: int, name: str, frames: list, paced: bool, stats: ReplayStats):
+    """Replay one captured session, returns True if every server frame matched"""
+    reader, writer = await asyncio.open_connection(host, port)
+    start = time.perf_counter()
+    try:
+        for index, (offset, direction, data) in enumerate(frames):
+            if direction == FROM_CLIENT:
+                if paced:
+                    delay = start + offset - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                writer.write(data)
+            else:
+                try:
+                    got = await reader.readexactly(len(data))
+                except asyncio.IncompleteReadError as e:
+                    got = e.partial
+                if got != data:
+                    stats.mismatches += 1
+                    if stats.first_mismatch is None:
+                        stats.first_mismatch = _describe_mismatch(name, index, data, got)
+                    return False
+            stats.frames += 1
+            stats.bytes += len(data)
+        stats.sessions += 1
+        return True
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def run_replay(
+    host: str,
+    port: int,
+    captures: list,
+    concurrency: int,
+    repeat: int = 1,
+    paced: bool = False,
+) -> dict:
+    """Replay every capture `repeat` times, at most `concurrency` sessions at once"""
+    stats = ReplayStats()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(name: str, frames: list):
+        async with slots:
+            try:
+                await replay_session(host, port, name, frames, paced, stats)
+            except (ConnectionError, OSError) as e:
+                stats.errors += 1
+                print(f"[REPLAY] {name}: {e!r}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(name, frames) for _ in range(repeat) for name, frames in captures))
+    return stats.summary(time.perf_counter() - start)
+
+
+def load_captures(paths: list) -> tuple[list, set]:
+    """[(name, frames)] of every capture file (directories are searched for *.cap), and the seeds used"""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "*.cap"))) if os.path.isdir(path) else [path])
+    captures, seeds = [], set()
+    for path in files:
+        meta, frames = capture.load(path)
+        if not frames:
+            # nothing to send or check, it would only count as a match
+            print(f"[REPLAY] Skipping {path}, it has no frames")
+            continue
+        seeds.add(meta.get("seed"))
+        captures.append((os.path.basename(path), frames))
+    return captures, seeds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured sessions and check the replies byte for byte")
+    parser.add_argument("paths", nargs="+", help="capture files or directories of them")
+    parser.add_argument("--host", default=None, help="connect directly, skipping UDP discovery")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=100, help="sessions replayed at once")
+    parser.add_argument("--repeat", type=int, default=1, help="replay every capture this many times")
+    parser.add_argument("--paced", action="store_true",
+                        help="send client frames at their original time offsets instead of right away")
+    parser.add_argument("--json", default=None, metavar="PATH", help="also write the summary as JSON")
+    args = parser.parse_args()
+
+    captures, seeds = load_captures(args.paths)
+    if not captures:
+        parser.error("no captures found")
+    if None in seeds:
+        print("[REPLAY] Some captures were recorded without --seed, their replies will not match")
+    if len(seeds - {None}) > 1:
+        print(f"[REPLAY] Captures come from different seeds: {sorted(seeds - {None})}")
+    print(f"[REPLAY] {len(captures)} sessions loaded (server seed {', '.join(map(str, seeds))})")
+
+    host: Optional[str] = args.host
+    port: Optional[int] = args.port
+    if host is None or port is None:
+        print("[REPLAY] Listening for server offers...")
+        host, port, server_name = listen_for_offers(timeout=5.0)
+        print(f"[REPLAY] Found {server_name} at {host}:{port}")
+
+    summary = asyncio.run(run_replay(host, port, captures, args.concurrency, args.repeat, args.paced))
+    print(f"[REPLAY] Sessions: {summary['sessions']} matched, {summary['mismatches']} mismatched, "
+          f"{summary['errors']} errors in {summary['elapsed_s']:.2f}s")
+    print(f"[REPLAY] {summary['sessions_per_s']:.1f} sessions/s, {summary['frames_per_s']:.1f} frames/s")
+    if summary["first_mismatch"]:
+        print(f"[REPLAY] First mismatch: {summary['first_mismatch']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if summary["mismatches"] or summary["errors"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
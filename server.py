@@ -1,140 +1,361 @@
 import socket
+import argparse
+import queue
+import threading
+from typing import Callable, Optional
+import logging
+from time import perf_counter
+import log_manager
+import metrics
+import profiling
+import journal
+import capture
+import deadlines
 from networkManager import *
 from my_utils import *
-from game import BlackjackGame
+from game import BlackjackGame, Shoe, shoe_factory, DEFAULT_DECKS, DEFAULT_PENETRATION
+from tcp import DEFAULT_BACKLOG
+import interfaces
 
 SERVER_NAME = "birds are real?"
 ACCEPT_TIMEOUT = 1.0  # seconds
+BUSY_GRACE = 0.1  # seconds a connection waits for a session that is just ending before it is turned away
 
+_log = log_manager.get_logger("server")
 
-def handle_client(client_sock: socket.socket, client_ip: str):
-    print(f"[SERVER] Client connected from {client_ip}")
 
-    try:
-        # ---- receive request ----
-        data = safe_recv(client_sock, MessageLength.REQUEST.value)
-        num_rounds, client_name = unpack_request(data)
+class BusyResponder:
+    """
+    Admission control of the serial engine, which serves one session at a time.
+    The accepting happens on a side thread: with nothing being served a connection is handed to
+    the main loop, while a session is being served it gets a busy reply right away instead of
+    waiting in the listen backlog. A connection that arrives as the session is ending (a client
+    starting its next session right away) gets BUSY_GRACE to see it end before it is turned away.
+    """
 
-        print(f"[SERVER] Client '{client_name}' requested {num_rounds} rounds")
+    def __init__(self, server_sock: socket.socket):
+        self.server_sock = server_sock
+        self._idle = threading.Event()
+        self._idle.set()
+        self._handoff = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
 
-        for round_idx in range(1, num_rounds + 1):
-            print(f"\n[SERVER] === Round {round_idx} ===")
+    def load(self) -> tuple[int, int]:
+        """(active sessions, capacity) - what the extended offer advertises"""
+        return int(not self._idle.is_set()), 1
+
+    def accept(self):
+        """Next connection for the main loop, (None, None) if none came within ACCEPT_TIMEOUT"""
+        try:
+            return self._handoff.get(timeout=ACCEPT_TIMEOUT)
+        except queue.Empty:
+            return None, None
 
-            game = BlackjackGame()
+    def done(self):
+        """The main loop finished the session it was handed"""
+        self._idle.set()
 
-            player_hand = [game.draw_card(), game.draw_card()]
-            dealer_hand = [game.draw_card(), game.draw_card()]
+    def _run(self):
+        while not self._stop.is_set():
+            client_sock, client_ip = accept_tcp_connection_with_timeout(self.server_sock, ACCEPT_TIMEOUT)
+            if client_sock is None:
+                continue
+            if self._idle.wait(BUSY_GRACE):
+                # busy from the hand off on, so the next connection cannot queue up behind this one
+                self._idle.clear()
+                self._handoff.put((client_sock, client_ip))
+                continue
+            metrics.BUSY.inc()
+            try:
+                client_sock.settimeout(ACCEPT_TIMEOUT)
+                client_sock.sendall(pack_busy(BUSY_RETRY_MS, 1))
+            except OSError:
+                pass
+            finally:
+                client_sock.close()
 
-            print("[SERVER] Player cards:", ", ".join(map(str, player_hand)))
-            print("[SERVER] Dealer shows:", dealer_hand[0])
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="acceptor", daemon=True)
+        self._thread.start()
 
-            # ---- send initial 3 cards ----
-            for card in player_hand:
-                client_sock.sendall(
-                    pack_server_payload(card, GameState.NOT_OVER)
-                )
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
-            client_sock.sendall(
-                pack_server_payload(dealer_hand[0], GameState.NOT_OVER)
+
+def handle_client(client_sock: socket.socket, client_ip: str, new_shoe: Callable[[str], Shoe] = shoe_factory()):
+    session_start = perf_counter()
+    log = log_manager.session_logger(_log)
+    log.info("[SERVER] Client connected from %s", client_ip)
+    reader = FrameReader(client_sock)
+    writer = SessionWriter(client_sock)
+    cap = capture.session(client_ip)
+    round_log = None
+    limits = deadlines.SocketDeadlines(client_sock)
+    probe = False
+    rounds_played = 0
+
+    try:
+        # ---- receive request ----
+        limits.phase(deadlines.REQUEST)
+        data = reader.read_frame(MessageLength.REQUEST.value)
+        stand_on = None
+        if data[4] == MessageType.BULK_REQUEST.value:
+            # a bulk request is longer - the rest of it follows
+            data = bytes(data) + bytes(
+                reader.read_frame(MessageLength.BULK_REQUEST.value - MessageLength.REQUEST.value)
             )
+            num_rounds, client_name, stand_on = unpack_bulk_request(data)
+        else:
+            num_rounds, client_name = unpack_request(data)
+        cap.request(data, client_name)
+        metrics.REQUEST.observe(perf_counter() - session_start)
+        limits.clear()
+
+        log.info("[SERVER] Client '%s' requested %d rounds", client_name, num_rounds)
+        profiling.annotate(client_name=client_name, requested_rounds=num_rounds, bulk=stand_on is not None)
+        verbose = log.isEnabledFor(logging.DEBUG)
+        # one shoe and game for the whole session, only a reshuffle now and then between rounds
+        game = BlackjackGame(new_shoe(client_name))
+        round_log = journal.session(client_name, bulk=stand_on is not None)
+
+        if stand_on is not None:
+            # bulk mode - no decisions over the wire, the results go out in large batches
+            for records in game.play_bulk(num_rounds, stand_on, on_round=round_log.round):
+                header = pack_bulk_header(len(records) // BULK_RECORD_LENGTH)
+                writer.write(header)
+                writer.write(records)
+                cap.server(header)
+                cap.server(records)
+                # a client that stops reading misses the decision deadline here, as it would in interactive play
+                limits.phase(deadlines.DECISION)
+                writer.flush()
+                limits.clear()
+                rounds_played += len(records) // BULK_RECORD_LENGTH
+            metrics.ROUNDS.inc(num_rounds)
+            metrics.SESSIONS.inc()
+            log.info("[SERVER] Finished bulk session with %s", client_name)
+            return
+
+        for round_idx in range(1, num_rounds + 1):
+            log.debug("\n[SERVER] === Round %d ===", round_idx)
+
+            rnd = game.new_round()
 
-            # ---- player turn ----
-            while True:
-                if sum(c.value() for c in player_hand) > 21:
-                    print("[SERVER] Player busts")
-                    client_sock.sendall(
-                        pack_server_payload(player_hand[-1], GameState.LOSS)
-                    )
-                    break
+            # ---- initial 3 cards (and the loss right away on two aces) ----
+            for card, state in rnd.deal():
+                payload = pack_server_payload(card, state)
+                writer.write(payload)
+                cap.server(payload)
+            player_hand, dealer_hand = rnd.player_hand, rnd.dealer_hand
 
-                decision = unpack_client_payload(
-                    safe_recv(client_sock, MessageLength.CLIENT_PAYLOAD.value)
-                )
+            log.debug("[SERVER] Player cards: %s", player_hand)
+            log.debug("[SERVER] Dealer shows: %s", dealer_hand[0])
+
+            # ---- player turn, then the dealer turn once the player stands ----
+            while not rnd.over:
+                # a slow reader counts against the decision too - it stays armed until the next phase
+                limits.phase(deadlines.DECISION)
+                writer.flush()  # everything the client needs before deciding goes out together
+                sent = perf_counter()
+                frame = reader.read_frame(MessageLength.CLIENT_PAYLOAD.value)
+                cap.client(frame)
+                decision = unpack_client_payload(frame)
+                metrics.DECISION.observe(perf_counter() - sent)
+                metrics.DECISIONS.inc()
 
                 if decision == PlayerDecision.HIT:
-                    card = game.draw_card()
-                    player_hand.append(card)
-                    print("[SERVER] Player hits:", card)
-                    print("[SERVER] Player cards:", ", ".join(map(str, player_hand)))
-                    print("[SERVER] Dealer shows:", dealer_hand[0])
-                    if sum(c.value() for c in player_hand) > 21:
-                        client_sock.sendall(
-                            pack_server_payload(card, GameState.LOSS)
-                        )
-                        break
-                    client_sock.sendall(
-                        pack_server_payload(card, GameState.NOT_OVER)
-                    )
+                    sends = rnd.decide(decision)
+                    if verbose:
+                        log.debug("[SERVER] Player hits: %s", player_hand[-1])
+                        log.debug("[SERVER] Player cards: %s", player_hand)
+                        log.debug("[SERVER] Dealer shows: %s", dealer_hand[0])
                 else:
-                    print("[SERVER] Player stands")
-                    break
-
-            # ---- dealer turn ----
-            if sum(c.value() for c in player_hand) <= 21:
-                # reveal hidden card
-                print("[SERVER] Dealer reveals:", dealer_hand[1])
-                if sum(c.value() for c in dealer_hand) < 17:
-                    client_sock.sendall(
-                        pack_server_payload(dealer_hand[1], GameState.NOT_OVER)
-                    )
-
-                #draw for as long as needed
-                while sum(c.value() for c in dealer_hand) < 17:
-                    card = game.draw_card()
-                    dealer_hand.append(card)
-                    print("[SERVER] Dealer hits:", card)
-
-                    if sum(c.value() for c in dealer_hand) < 17:
-                        client_sock.sendall(
-                            pack_server_payload(card, GameState.NOT_OVER)
-                        )
-
-                # ---- decide result ----
-                p = sum(c.value() for c in player_hand)
-                d = sum(c.value() for c in dealer_hand)
-
-                if d > 21 or p > d:
-                    result = GameState.WIN
-                elif p < d:
-                    result = GameState.LOSS
+                    log.debug("[SERVER] Player stands")
+                    dealer_start = perf_counter()
+                    sends = rnd.decide(decision)
+                    metrics.DEALER.observe(perf_counter() - dealer_start)
+                for card, state in sends:
+                    payload = pack_server_payload(card, state)
+                    writer.write(payload)
+                    cap.server(payload)
+
+            if verbose:
+                if player_hand.busted:
+                    log.debug("[SERVER] Player busts")
                 else:
-                    result = GameState.TIE
-                print("[SERVER] Player cards:", ", ".join(map(str, player_hand)))
-                print("[SERVER] Dealer shows:", dealer_hand)
-                print(f"[SERVER] Player card values sum: {sum(c.value() for c in player_hand)}")
-                print(f"[SERVER] Dealer card values sum: {sum(c.value() for c in dealer_hand)}")
-                print(f"[SERVER] Result: {result.name}")
-                client_sock.sendall(
-                    pack_server_payload(dealer_hand[-1], result)
-                )
+                    log.debug("[SERVER] Dealer reveals: %s", dealer_hand[1])
+                    for card in dealer_hand[2:]:
+                        log.debug("[SERVER] Dealer hits: %s", card)
+                    log.debug("[SERVER] Player cards: %s", player_hand)
+                    log.debug("[SERVER] Dealer shows: %s", dealer_hand)
+                    log.debug("[SERVER] Player card values sum: %d", player_hand.total)
+                    log.debug("[SERVER] Dealer card values sum: %d", dealer_hand.total)
+                log.debug("[SERVER] Result: %s", rnd.result.name)
+            round_log.round(player_hand, dealer_hand, rnd.result)
+            rounds_played += 1
+            metrics.ROUNDS.inc()
+
+        limits.clear()
+        writer.flush()
+        metrics.SESSIONS.inc()
+        log.info("[SERVER] Finished session with %s", client_name)
 
-        print(f"\n[SERVER] Finished session with {client_name}")
+    except socket.timeout:
+        log.warning("[SERVER] Client timed out, %s deadline missed", limits.expire())
 
-    except (ConnectionError, ValueError, socket.timeout) as e:
-        print(f"[SERVER] Client error: {e}")
+    except ConnectionError as e:
+        if reader.bytes_received == 0:
+            # closed before sending a single byte - a discovery RTT probe, not a failed session
+            probe = True
+            log.debug("[SERVER] %s closed without a request", client_ip)
+        else:
+            metrics.SESSION_ERRORS.inc()
+            log.warning("[SERVER] Client error: %s", e)
+
+    except ValueError as e:
+        metrics.SESSION_ERRORS.inc()
+        log.warning("[SERVER] Client error: %s", e)
 
     finally:
         client_sock.close()
-        print(f"[SERVER] Connection closed for {client_ip}")
+        if round_log is not None:
+            round_log.close()
+        cap.close()
+        profiling.annotate(rounds_played=rounds_played)
+        if not probe:
+            metrics.SESSION.observe(perf_counter() - session_start)
+        log.info("[SERVER] Connection closed for %s", client_ip)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Blackjack game server")
+    parser.add_argument("--engine", choices=("serial", "async"), default="serial",
+                        help="serial: one session at a time, async: many sessions on one event loop")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS,
+                        help="max concurrent sessions (async engine, per worker with --workers) - "
+                             "the serial engine serves one and answers the rest busy")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="pre-fork this many async worker processes (0 = one per core)")
+    parser.add_argument("--table-size", type=int, default=None, metavar="SEATS",
+                        help="seat players at shared-dealer tables of this many seats (async engine / --workers)")
+    parser.add_argument("--turn-timeout", type=float, default=DEFAULT_TURN_TIMEOUT,
+                        help="seconds a table seat gets per decision before it is stood and removed")
+    parser.add_argument("--request-timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT,
+                        help="seconds a client gets to send its request (0 = no limit)")
+    parser.add_argument("--decision-timeout", type=float, default=DEFAULT_DECISION_TIMEOUT,
+                        help="seconds a client gets for each decision (0 = no limit)")
+    parser.add_argument("--session-timeout", type=float, default=DEFAULT_SESSION_TIMEOUT,
+                        help="seconds a whole session may last (0 = no limit)")
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG,
+                        help="pending connection queue length of the listening socket")
+    parser.add_argument("--interface", default=None,
+                        help="send offers on this network interface (default: the default route's)")
+    parser.add_argument("--broadcast", default=None, metavar="ADDR",
+                        help="send offers to this broadcast address, skipping interface lookup")
+    parser.add_argument("--decks", type=int, default=DEFAULT_DECKS, help="decks per session shoe")
+    parser.add_argument("--penetration", type=float, default=DEFAULT_PENETRATION,
+                        help="reshuffle once this fraction of the shoe has been dealt")
+    parser.add_argument("--seed", default=None,
+                        help="seed every session shoe from this and the client name, for reproducible runs "
+                             "(sessions under the same name get the same cards)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve Prometheus text metrics on this loopback port (worker i uses port + i, "
+                             "0 picks a free one)")
+    parser.add_argument("--profile-dir", default=None,
+                        help="write profiles here, SIGUSR1 then toggles a profile of the whole process")
+    parser.add_argument("--profile-sample", type=float, default=0.0,
+                        help="fraction of sessions to profile with cProfile (needs --profile-dir)")
+    parser.add_argument("--no-profile-memory", dest="profile_memory", action="store_false",
+                        help="skip the tracemalloc snapshots")
+    parser.add_argument("--journal", default=None, metavar="PATH",
+                        help="append every round to this binary journal (worker i writes PATH.i)")
+    parser.add_argument("--capture", default=None, metavar="DIR",
+                        help="record every session's frames into DIR for replay.py (use with --seed)")
+    parser.add_argument("--log-level", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="DEBUG also logs every card dealt")
+    parser.add_argument("--log-file", default=None, help="also write the log to this file")
+    parser.add_argument("--log-sample", type=float, default=1.0,
+                        help="fraction of sessions whose debug/info records are logged")
+    args = parser.parse_args()
+    if args.decks < 1:
+        parser.error("--decks must be at least 1")
+    if not 0 < args.penetration <= 1:
+        parser.error("--penetration must be above 0 and at most 1")
+    return args
 
 
 def main():
-    server_sock = create_tcp_server()
+    args = parse_args()
+    log_manager.configure(getattr(logging, args.log_level), args.log_file, sample_rate=args.log_sample)
+    new_shoe = shoe_factory(args.decks, args.penetration, args.seed)
+    interfaces.configure(args.interface, args.broadcast)
+    deadlines.configure(args.request_timeout, args.decision_timeout, args.session_timeout)
+    if args.seed is not None:
+        print("[SERVER] Seeded shoes: every session under the same client name is dealt the same cards")
+    if args.capture is not None:
+        if args.seed is None:
+            print("[SERVER] Capturing without --seed, replayed sessions will not get the same cards")
+        capture.configure(args.capture, args.seed)
+    if args.profile_dir is not None:
+        profiling.configure(args.profile_dir, args.profile_sample, args.profile_memory)
+    if args.workers is not None:
+        # the engines pull in asyncio / multiprocessing, only import the one that runs
+        from worker_server import run_worker_server
+        run_worker_server(SERVER_NAME, args.workers, args.max_sessions, new_shoe, args.backlog, args.metrics_port,
+                          args.journal, args.table_size, args.turn_timeout)
+        return
+    if args.journal is not None:
+        journal.configure(args.journal)
+
+    server_sock = create_tcp_server(backlog=args.backlog)
     tcp_port = server_sock.getsockname()[1]
 
     print(f"[SERVER] Server started, listening on TCP port {tcp_port}")
 
-    while True:
-        print(f"[SERVER] Broadcasting offer")
-        broadcast_offer(SERVER_NAME, tcp_port)
-        client_sock, client_ip = accept_tcp_connection_with_timeout(
-            server_sock, ACCEPT_TIMEOUT
-        )
+    if args.table_size and args.engine != "async":
+        print("[SERVER] --table-size needs the async engine or --workers, serving private sessions")
+
+    if args.engine == "async":
+        from async_server import run_async_server
+        from table_server import TableManager
+        tables = TableManager(new_shoe, args.table_size, args.turn_timeout) if args.table_size else None
+        run_async_server(server_sock, SERVER_NAME, args.max_sessions, new_shoe, args.backlog, args.metrics_port,
+                         tables)
+        return
+
+    # offers keep going out on their own thread, also while a session is being served
+    # one session at a time - the offer advertises whether it is in use, and others get a busy reply
+    responder = BusyResponder(server_sock)
+    responder.start()
+    announcer = OfferAnnouncer(SERVER_NAME, tcp_port, load_provider=responder.load)
+    announcer.start()
+    print(f"[SERVER] Broadcasting offers")
+    stats = metrics.MetricsServer(args.metrics_port) if args.metrics_port is not None else None
+    if stats is not None:
+        stats.start()
+        print(f"[SERVER] Metrics on 127.0.0.1:{stats.port}")
 
-        if client_sock is None:
-            continue
+    try:
+        while True:
+            client_sock, client_ip = responder.accept()
+
+            if client_sock is None:
+                continue
 
-        handle_client(client_sock, client_ip)
+            try:
+                with profiling.session_profile(client_ip):
+                    handle_client(client_sock, client_ip, new_shoe)
+            finally:
+                responder.done()
+    finally:
+        responder.stop()
+        announcer.stop()
+        if stats is not None:
+            stats.stop()
 
 
 if __name__ == "__main__":
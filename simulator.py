@@ -0,0 +1,185 @@
+import argparse
+import math
+from typing import Union
+import numpy as np
+from my_utils import CARD_VALUE, NUM_CARDS, GameState, PlayerDecision
+from game import BlackjackGame
+
+'''batch Monte Carlo simulator - plays millions of rounds under the BlackjackGame rules
+(Ace = 11, dealer hits below 17) with numpy arrays instead of one python callback per decision'''
+
+MAX_TOTAL = 32          # policy tables cover player totals 0..31
+MAX_UPCARD = 12         # and dealer upcard values 0..11
+DEFAULT_BATCH_SIZE = 100_000
+Z_95 = 1.959964         # two sided 95% normal quantile
+
+_CARD_VALUES = np.frombuffer(CARD_VALUE, dtype=np.uint8).astype(np.int16)
+
+
+def threshold_policy(stand_on: int) -> np.ndarray:
+    """Policy table that hits while the player total is below stand_on, whatever the dealer shows"""
+    table = np.zeros((MAX_TOTAL, MAX_UPCARD), dtype=bool)
+    table[:stand_on, :] = True
+    return table
+
+
+def as_policy_table(policy: Union[int, np.ndarray]) -> np.ndarray:
+    """Accept a stand-on threshold or a bool hit table indexed [player_total, dealer_upcard_value]"""
+    if isinstance(policy, (int, np.integer)):
+        return threshold_policy(int(policy))
+    table = np.asarray(policy, dtype=bool)
+    if table.shape != (MAX_TOTAL, MAX_UPCARD):
+        raise ValueError(f"Policy table must have shape {(MAX_TOTAL, MAX_UPCARD)}")
+    return table
+
+
+def shuffled_decks(rng: np.random.Generator, count: int) -> np.ndarray:
+    """count independent shuffled decks of card ids, in BlackjackGame.deck order (drawn from the end)"""
+    decks = np.tile(np.arange(NUM_CARDS, dtype=np.uint8), (count, 1))
+    return rng.permuted(decks, axis=1)
+
+
+def play_batch(policy_table: np.ndarray, decks: np.ndarray) -> np.ndarray:
+    """
+    Play one round per deck, all at once.
+    Returns the GameState value (WIN / LOSS / TIE) of every round.
+    """
+    count = decks.shape[0]
+    rows = np.arange(count)
+    # card values in draw order: column 0 is the first card dealt
+    values = _CARD_VALUES[decks[:, ::-1]]
+
+    # --- Initial deal ---
+    player = values[:, 0] + values[:, 1]
+    upcard = values[:, 2]
+    dealer = values[:, 2] + values[:, 3]
+    pos = np.full(count, 4)
+
+    # --- Player turn ---
+    active = player <= 21
+    while True:
+        hit = active & policy_table[np.minimum(player, MAX_TOTAL - 1), upcard]
+        if not hit.any():
+            break
+        idx = rows[hit]
+        player[idx] += values[idx, pos[idx]]
+        pos[idx] += 1
+        active = hit & (player <= 21)
+
+    # --- Dealer turn (only when the player did not bust) ---
+    drawing = (player <= 21) & (dealer < 17)
+    while drawing.any():
+        idx = rows[drawing]
+        dealer[idx] += values[idx, pos[idx]]
+        pos[idx] += 1
+        drawing &= dealer < 17
+
+    # --- Decide winner ---
+    result = np.full(count, GameState.TIE.value, dtype=np.uint8)
+    result[player < dealer] = GameState.LOSS.value
+    result[(player > dealer) | (dealer > 21)] = GameState.WIN.value
+    result[player > 21] = GameState.LOSS.value
+    return result
+
+
+class SimulationResult:
+    """Win / loss / tie counts of a simulation, with normal approximation confidence intervals"""
+
+    def __init__(self, wins: int, losses: int, ties: int):
+        self.wins = wins
+        self.losses = losses
+        self.ties = ties
+
+    @property
+    def rounds(self) -> int:
+        return self.wins + self.losses + self.ties
+
+    def rate(self, count: int) -> float:
+        return count / self.rounds if self.rounds else 0.0
+
+    def interval(self, count: int, z: float = Z_95) -> tuple[float, float]:
+        """Confidence interval of count / rounds"""
+        p = self.rate(count)
+        half = z * math.sqrt(p * (1 - p) / self.rounds) if self.rounds else 0.0
+        return p - half, p + half
+
+    @property
+    def house_edge(self) -> float:
+        """Expected player loss per unit bet"""
+        return self.rate(self.losses) - self.rate(self.wins)
+
+    def __str__(self):
+        lines = [f"Rounds: {self.rounds}"]
+        for name, count in (("Wins", self.wins), ("Losses", self.losses), ("Ties", self.ties)):
+            low, high = self.interval(count)
+            lines.append(f"{name}: {self.rate(count):.4f} (95% CI {low:.4f} - {high:.4f})")
+        lines.append(f"House edge: {self.house_edge:+.4f}")
+        return "\n".join(lines)
+
+
+def simulate(
+    policy: Union[int, np.ndarray],
+    rounds: int,
+    seed=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> SimulationResult:
+    """Play `rounds` independent rounds, each from a freshly shuffled deck"""
+    table = as_policy_table(policy)
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(4, dtype=np.int64)
+    remaining = rounds
+    while remaining > 0:
+        batch = min(batch_size, remaining)
+        counts += np.bincount(play_batch(table, shuffled_decks(rng, batch)), minlength=4)
+        remaining -= batch
+    return SimulationResult(
+        int(counts[GameState.WIN.value]),
+        int(counts[GameState.LOSS.value]),
+        int(counts[GameState.TIE.value]),
+    )
+
+
+def verify_against_engine(policy: Union[int, np.ndarray], rounds: int = 10_000, seed=0) -> int:
+    """
+    Play the same seeded shuffles through BlackjackGame.play_round and through play_batch.
+    Returns the number of rounds where the results differ (0 means the simulator matches the engine).
+    """
+    table = as_policy_table(policy)
+    decks = shuffled_decks(np.random.default_rng(seed), rounds)
+    batch_results = play_batch(table, decks)
+
+    def decide(player_hand, dealer_card) -> PlayerDecision:
+        if table[min(player_hand.total, MAX_TOTAL - 1), dealer_card.value()]:
+            return PlayerDecision.HIT
+        return PlayerDecision.STAND
+
+    mismatches = 0
+    game = BlackjackGame()
+    for deck, expected in zip(decks, batch_results):
+        game.deck = bytearray(deck.tobytes())
+        _, _, state = game.play_round(decide)
+        if state.value != expected:
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch Monte Carlo simulator for the blackjack rules")
+    parser.add_argument("--rounds", type=int, default=1_000_000)
+    parser.add_argument("--stand-on", type=int, default=17, help="hit while the player total is below this")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verify", type=int, default=0, metavar="N",
+                        help="first check N seeded rounds against BlackjackGame.play_round")
+    args = parser.parse_args()
+
+    if args.verify:
+        mismatches = verify_against_engine(args.stand_on, args.verify, args.seed or 0)
+        print(f"[SIM] Verified {args.verify} rounds against play_round: {mismatches} mismatches")
+        if mismatches:
+            raise SystemExit(1)
+
+    print(simulate(args.stand_on, args.rounds, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+from functools import lru_cache
+from my_utils import CARD_VALUE, NUM_CARDS, PlayerDecision
+
+'''optimal HIT/STAND strategy for the BlackjackGame rules (Ace = 11, dealer hits below 17, ties push).
+solved once with an infinite deck approximation and kept as a compact lookup table'''
+
+MAX_TOTAL = 32    # table covers player totals 0..31
+MAX_UPCARD = 12   # and dealer upcard values 0..11
+
+# probability of drawing each card value (2..11)
+_VALUE_PROBS = {value: CARD_VALUE.count(value) / NUM_CARDS for value in set(CARD_VALUE)}
+
+
+@lru_cache(maxsize=None)
+def _dealer_final(total: int) -> tuple:
+    """Distribution of the dealer's final total (22 = bust) starting from `total`, as a 23-tuple"""
+    dist = [0.0] * 23
+    if total >= 17:
+        dist[min(total, 22)] = 1.0
+        return tuple(dist)
+    for value, prob in _VALUE_PROBS.items():
+        for final, p in enumerate(_dealer_final(total + value)):
+            dist[final] += prob * p
+    return tuple(dist)
+
+
+def _dealer_from_upcard(upcard: int) -> list:
+    """Dealer final total distribution given the visible card (the hole card is still unknown)"""
+    dist = [0.0] * 23
+    for value, prob in _VALUE_PROBS.items():
+        for final, p in enumerate(_dealer_final(upcard + value)):
+            dist[final] += prob * p
+    return dist
+
+
+def _stand_ev(player_total: int, dealer_dist: list) -> float:
+    """Expected result (+1 win, -1 loss, 0 tie) of standing on player_total"""
+    ev = dealer_dist[22]  # dealer busts
+    for final in range(17, 22):
+        if player_total > final:
+            ev += dealer_dist[final]
+        elif player_total < final:
+            ev -= dealer_dist[final]
+    return ev
+
+
+def solve() -> dict:
+    """
+    Expected value of the best play for every (player_total, dealer_upcard_value) state.
+    Returns {(total, upcard): (ev, PlayerDecision)}.
+    """
+    solution = {}
+    for upcard in range(2, MAX_UPCARD):
+        dealer_dist = _dealer_from_upcard(upcard)
+        # work down from 21, hitting only ever moves to a higher total
+        for total in range(21, 3, -1):
+            stand = _stand_ev(total, dealer_dist)
+            hit = 0.0
+            for value, prob in _VALUE_PROBS.items():
+                if total + value > 21:
+                    hit -= prob
+                else:
+                    hit += prob * solution[total + value, upcard][0]
+            if hit > stand:
+                solution[total, upcard] = (hit, PlayerDecision.HIT)
+            else:
+                solution[total, upcard] = (stand, PlayerDecision.STAND)
+    return solution
+
+
+@lru_cache(maxsize=None)
+def strategy_table() -> bytes:
+    """Compact lookup table: table[total * MAX_UPCARD + upcard] is 1 for HIT, 0 for STAND"""
+    table = bytearray(MAX_TOTAL * MAX_UPCARD)
+    for (total, upcard), (_, decision) in solve().items():
+        if decision == PlayerDecision.HIT:
+            table[total * MAX_UPCARD + upcard] = 1
+    return bytes(table)
+
+
+def stand_on_table(table: bytes = None) -> bytes:
+    """
+    The strategy as one stand-on total per dealer upcard value (the bulk mode policy):
+    the lowest total from 4 up (the smallest starting hand) the table stands on
+    """
+    table = strategy_table() if table is None else table
+    stand_on = bytearray(MAX_UPCARD)
+    for upcard in range(MAX_UPCARD):
+        total = 4
+        while total < MAX_TOTAL and table[total * MAX_UPCARD + upcard]:
+            total += 1
+        stand_on[upcard] = total
+    return bytes(stand_on)
+
+
+def optimal_decision(player_total: int, dealer_upcard_value: int) -> PlayerDecision:
+    """Best decision for a state, one table lookup"""
+    if player_total >= MAX_TOTAL:
+        return PlayerDecision.STAND
+    if strategy_table()[player_total * MAX_UPCARD + dealer_upcard_value]:
+        return PlayerDecision.HIT
+    return PlayerDecision.STAND
+
+
+if __name__ == "__main__":
+    # print the strategy as a chart: rows = player total, columns = dealer upcard
+    table = strategy_table()
+    print("total " + " ".join(f"{up:>2}" for up in range(2, MAX_UPCARD)))
+    for total in range(4, 22):
+        row = " ".join(" H" if table[total * MAX_UPCARD + up] else " S" for up in range(2, MAX_UPCARD))
+        print(f"{total:>5} {row}")
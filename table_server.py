@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+from time import perf_counter
+from typing import Callable, Optional
+import log_manager
+import metrics
+from networkManager import pack_server_payload, unpack_client_payload
+from my_utils import *
+from game import BlackjackGame, Shoe, TableRound
+
+'''multi-player tables for the asyncio engine - sessions become seats at a table that deals every round
+from one shoe against one dealer hand, so a table of N players costs one dealer simulation per round.
+the dealer upcard and the dealer's cards are encoded once and the same bytes go to every seat.
+seats decide at the same time, each against a turn deadline: a seat that misses it is stood and leaves
+the table after the round, so a slow or stuck client holds the others up for one turn timeout at most.
+every seat sees exactly the frames of a private session, clients need no changes'''
+
+DEFAULT_TABLE_SIZE = 6
+SEAT_WAIT = 0.05  # a new table waits this long for more players before its first deal
+
+_log = log_manager.get_logger("table_server")
+
+
+class Seat:
+    """One session seated at a table - the table plays it, the session's handler waits on done"""
+    __slots__ = ("reader", "writer", "client_name", "rounds_left", "rounds_played", "pending",
+                 "cap", "round_log", "log", "done", "error", "timed_out")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client_name: str,
+                 num_rounds: int, cap, round_log, log):
+        self.reader = reader
+        self.writer = writer
+        self.client_name = client_name
+        self.rounds_left = num_rounds
+        self.rounds_played = 0
+        # payloads due before the seat's next decision, handed to the transport in one writelines
+        self.pending: list[bytes] = []
+        self.cap = cap
+        self.round_log = round_log
+        self.log = log
+        self.done = asyncio.get_running_loop().create_future()
+        self.error: Optional[Exception] = None
+        self.timed_out = False
+
+    def send(self, payload: bytes):
+        self.pending.append(payload)
+        self.cap.server(payload)
+
+    async def flush(self, timeout: float):
+        if not self.pending:
+            return
+        start = perf_counter()
+        self.writer.writelines(self.pending)
+        self.pending.clear()
+        try:
+            await asyncio.wait_for(self.writer.drain(), timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError("Client is not reading")
+        metrics.WRITE.observe(perf_counter() - start)
+
+    async def decision(self, timeout: float) -> Optional[PlayerDecision]:
+        """The seat's next decision, None if it did not come within timeout"""
+        start = perf_counter()
+        try:
+            frame = await asyncio.wait_for(self.reader.readexactly(MessageLength.CLIENT_PAYLOAD.value), timeout)
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("Socket closed")
+        self.cap.client(frame)
+        decision = unpack_client_payload(frame)
+        metrics.DECISION.observe(perf_counter() - start)
+        metrics.DECISIONS.inc()
+        return decision
+
+    @property
+    def leaving(self) -> bool:
+        return self.rounds_left == 0 or self.timed_out or self.error is not None
+
+
+class Table:
+    """
+    One shoe, one dealer hand per round and up to size seats.
+    Sessions join between rounds, and the table closes once its last seat has left.
+    """
+
+    def __init__(self, name: str, new_shoe: Callable[[str], Shoe], size: int, turn_timeout: float):
+        self.name = name
+        self.size = size
+        self.turn_timeout = turn_timeout
+        self.game = BlackjackGame(new_shoe(name))
+        self.seats: list[Seat] = []
+        self.waiting: list[Seat] = []
+
+    @property
+    def free(self) -> int:
+        return self.size - len(self.seats) - len(self.waiting)
+
+    def join(self, seat: Seat):
+        """Take a seat from the next round on"""
+        self.waiting.append(seat)
+
+    async def run(self):
+        await asyncio.sleep(SEAT_WAIT)
+        try:
+            while True:
+                self.seats.extend(self.waiting)
+                self.waiting.clear()
+                if not self.seats:
+                    break
+                await self.play_round()
+                leaving = [seat for seat in self.seats if seat.leaving]
+                self.seats = [seat for seat in self.seats if not seat.leaving]
+                await asyncio.gather(*(self._release(seat) for seat in leaving))
+        finally:
+            for seat in self.seats + self.waiting:
+                if not seat.done.done():
+                    seat.done.set_exception(ConnectionError(f"{self.name} closed"))
+        _log.info("[SERVER] %s closed", self.name)
+
+    async def play_round(self):
+        seats = self.seats
+        rnd = self.game.new_table_round(len(seats))
+
+        # ---- own cards per seat, the upcard encoded once and shared ----
+        upcard, deal = rnd.deal()
+        upcard = pack_server_payload(*upcard)
+        for seat, sends in zip(seats, deal):
+            seat.send(pack_server_payload(*sends[0]))
+            seat.send(pack_server_payload(*sends[1]))
+            seat.send(upcard)
+            for card, state in sends[2:]:
+                seat.send(pack_server_payload(card, state))
+
+        # ---- every seat plays its hand at the same time ----
+        await asyncio.gather(*(self._turn(rnd, index, seat) for index, seat in enumerate(seats)))
+
+        # ---- one dealer turn for the whole table, encoded once ----
+        dealer_start = perf_counter()
+        sends, results = rnd.dealer_turn()
+        metrics.DEALER.observe(perf_counter() - dealer_start)
+        shared = [pack_server_payload(card, state) for card, state in sends]
+        finals = {}
+        for seat, result in zip(seats, results):
+            if result is None:
+                continue
+            for payload in shared:
+                seat.send(payload)
+            final = finals.get(result)
+            if final is None:
+                final = finals[result] = pack_server_payload(rnd.dealer_hand[-1], result)
+            seat.send(final)
+
+        for index, seat in enumerate(seats):
+            seat.round_log.round(rnd.player_hands[index], rnd.dealer_hand, rnd.results[index])
+            seat.rounds_played += 1
+            seat.rounds_left -= 1
+        metrics.ROUNDS.inc(len(seats))
+        metrics.TABLE_ROUNDS.inc()
+
+    async def _turn(self, rnd: TableRound, index: int, seat: Seat):
+        try:
+            while not rnd.seat_done(index):
+                await seat.flush(self.turn_timeout)
+                decision = await seat.decision(self.turn_timeout)
+                if decision is None:
+                    # out of time - stand for the seat, it leaves once the round is over
+                    seat.timed_out = True
+                    metrics.TURN_TIMEOUTS.inc()
+                    seat.log.warning("[SERVER] %s missed the %.1fs turn deadline at %s",
+                                     seat.client_name, self.turn_timeout, self.name)
+                    decision = PlayerDecision.STAND
+                for card, state in rnd.decide(index, decision):
+                    seat.send(pack_server_payload(card, state))
+        except (ConnectionError, ValueError) as e:
+            seat.error = e
+            if not rnd.seat_done(index):
+                rnd.decide(index, PlayerDecision.STAND)
+
+    async def _release(self, seat: Seat):
+        """Send what is left and hand the session back to its handler"""
+        if seat.error is None:
+            try:
+                await seat.flush(self.turn_timeout)
+            except ConnectionError as e:
+                seat.error = e
+        seat.done.set_result(None)
+
+
+class TableManager:
+    """Seats every session at an open table with a free seat, opening a new table when all are full"""
+
+    def __init__(
+        self,
+        new_shoe: Callable[[str], Shoe],
+        size: int = DEFAULT_TABLE_SIZE,
+        turn_timeout: float = DEFAULT_TURN_TIMEOUT,
+    ):
+        self.new_shoe = new_shoe
+        self.size = size
+        self.turn_timeout = turn_timeout
+        self._open: list[Table] = []
+        self._ids = itertools.count(1)
+        self._tasks = set()
+
+    def seat(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, client_name: str,
+             num_rounds: int, cap, round_log, log) -> Seat:
+        """Seat a session that asked for num_rounds, await the seat's done to know when it left"""
+        seat = Seat(reader, writer, client_name, num_rounds, cap, round_log, log)
+        if num_rounds <= 0:
+            seat.done.set_result(None)
+            return seat
+        table = next((table for table in self._open if table.free), None)
+        if table is None:
+            table = Table(f"table-{next(self._ids)}", self.new_shoe, self.size, self.turn_timeout)
+            self._open.append(table)
+            task = asyncio.create_task(self._run(table))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            _log.info("[SERVER] Opened %s", table.name)
+        table.join(seat)
+        log.info("[SERVER] Client '%s' seated at %s", client_name, table.name)
+        return seat
+
+    async def _run(self, table: Table):
+        try:
+            await table.run()
+        finally:
+            self._open.remove(table)
@@ -1,15 +1,28 @@
 import socket
 from typing import Tuple, Optional
 from my_utils import DEFAULT_TCP_PORT
+import metrics
 
 # -------------------------
 # TCP Functions
 # -------------------------
-def create_tcp_server() -> socket.socket:
-    """Create TCP server socket, OS picks port"""
+DEFAULT_BACKLOG = 128
+
+
+def create_tcp_server(
+    port: int = DEFAULT_TCP_PORT,
+    reuse_port: bool = False,
+    backlog: int = DEFAULT_BACKLOG,
+) -> socket.socket:
+    """Create TCP server socket, OS picks port unless one is given"""
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_sock.bind(('', DEFAULT_TCP_PORT))  # 0 = OS picks free port
-    server_sock.listen()
+    if reuse_port:
+        # lets several worker processes listen on the same port, kernel balances accepts
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    # small game messages must go out right away, not wait for Nagle / delayed ACK
+    server_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server_sock.bind(('', port))  # 0 = OS picks free port
+    server_sock.listen(backlog)  # bounded - connections beyond it are refused by the kernel
     return server_sock
 
 
@@ -21,6 +34,8 @@ def accept_tcp_connection_with_timeout(
     server_sock.settimeout(timeout)
     try:
         client_sock, addr = server_sock.accept()
+        client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        metrics.ACCEPTED.inc()
         return client_sock, addr[0]
     except socket.timeout:
         return None, None
@@ -29,6 +44,7 @@ def accept_tcp_connection_with_timeout(
 def connect_to_tcp_server(ip: str, port: int, timeout: float = 5.0) -> socket.socket:
     """Connect to server TCP socket"""
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     sock.settimeout(timeout)
     sock.connect((ip, port))
     return sock
\ No newline at end of file
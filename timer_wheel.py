@@ -0,0 +1,86 @@
+from time import monotonic
+from typing import Callable
+
+'''hashed timer wheel (Varghese & Lauck) - timers hash by expiry tick into a fixed ring of slots,
+so scheduling and cancelling are O(1) and every tick only looks at the timers of one slot,
+however many are pending. timers further out than one turn of the wheel stay in their slot and
+are skipped until their turn comes. expiry is rounded up to the next tick, timers fire up to one
+tick late and never early'''
+
+DEFAULT_TICK = 0.1  # seconds
+DEFAULT_SLOTS = 512
+
+
+class Timer:
+    """A scheduled callback, cancel() it once it is no longer needed"""
+    __slots__ = ("expires", "callback", "args", "_wheel")
+
+    def __init__(self, wheel: "HashedTimerWheel", expires: int, callback: Callable, args: tuple):
+        self.expires = expires  # tick number
+        self.callback = callback
+        self.args = args
+        self._wheel = wheel
+
+    @property
+    def active(self) -> bool:
+        return self._wheel is not None
+
+    def cancel(self):
+        if self._wheel is not None:
+            self._wheel._remove(self)
+
+
+class HashedTimerWheel:
+    """
+    Timers with a resolution of tick seconds on a ring of slots.
+    Nothing runs on its own - call advance() at least once per tick (an event loop callback,
+    a server loop) and it fires everything that has expired since the last call.
+    """
+
+    def __init__(self, tick: float = DEFAULT_TICK, slots: int = DEFAULT_SLOTS,
+                 clock: Callable[[], float] = monotonic):
+        self.tick = tick
+        self.clock = clock
+        # dicts keep insertion order and remove in O(1), the values are unused
+        self._slots: list[dict] = [{} for _ in range(slots)]
+        self._current = int(clock() / tick)  # last tick processed
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """Call callback(*args) once delay seconds have passed"""
+        expires = max(-int(-(self.clock() + delay) // self.tick), self._current + 1)
+        timer = Timer(self, expires, callback, args)
+        self._slots[expires % len(self._slots)][timer] = None
+        self._count += 1
+        return timer
+
+    def _remove(self, timer: Timer):
+        del self._slots[timer.expires % len(self._slots)][timer]
+        timer._wheel = None
+        self._count -= 1
+
+    def advance(self) -> int:
+        """Fire every timer that has expired, returns how many did"""
+        now = int(self.clock() / self.tick)
+        if now <= self._current:
+            return 0
+        slots = self._slots
+        # after a stall of a whole turn or more, every slot is looked at once
+        start = max(self._current + 1, now - len(slots) + 1)
+        expired = []
+        for tick in range(start, now + 1):
+            slot = slots[tick % len(slots)]
+            if slot:
+                due = [timer for timer in slot if timer.expires <= now]
+                for timer in due:
+                    del slot[timer]
+                    timer._wheel = None
+                expired.extend(due)
+        self._current = now
+        self._count -= len(expired)
+        for timer in expired:
+            timer.callback(*timer.args)
+        return len(expired)
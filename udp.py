@@ -1,8 +1,8 @@
 import socket
-import psutil
-import ipaddress
 import struct
-from typing import Tuple, Optional
+import threading
+import time
+from typing import Callable, Tuple, Optional
 from my_utils import (
     MAGIC_COOKIE,
     BROADCAST_UDP_PORT,
@@ -11,31 +11,119 @@ from my_utils import (
     MessageType,
     fix_name_length,
 )
+from interfaces import InterfaceResolver, default_resolver
 # -------------------------
 # UDP Functions (Server/Client)
 # -------------------------
-def broadcast_offer(server_name: str, tcp_port: int):
-    """Server: send one UDP offer"""
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
-    server_name_bytes = fix_name_length(server_name)
-    msg = struct.pack(
+def pack_offer(server_name: str, tcp_port: int) -> bytes:
+    """Pack a UDP offer message"""
+    return struct.pack(
         MessageFormat.OFFER.value,
         MAGIC_COOKIE,
         MessageType.OFFER.value,
         tcp_port,
-        server_name_bytes
+        fix_name_length(server_name)
     )
-    local_ip=get_local_ip()
-    ip_parts=local_ip.split(".")
+
+
+_LOAD = struct.Struct("!HH")
+
+
+def pack_offer_load(offer: bytes, active_sessions: int, capacity: int) -> bytes:
+    """Extend a packed offer with the server load (active sessions, total capacity)"""
+    return offer + _LOAD.pack(min(active_sessions, 0xFFFF), min(capacity, 0xFFFF))
+
+
+def broadcast_offer(server_name: str, tcp_port: int):
+    """Server: send one UDP offer"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    msg = pack_offer(server_name, tcp_port)
     broadcast_ip=get_broadcast_address()
     sock.sendto(msg, (broadcast_ip, BROADCAST_UDP_PORT))
     sock.close()
 
 
-def listen_for_offers(timeout: Optional[float] = None) -> Tuple[str, int, str]:
-    """Client: listen for UDP offer, return (server_ip, tcp_port, server_name)"""
+class OfferAnnouncer:
+    """
+    Server: long lived offer broadcaster.
+    Keeps one socket and one pre-packed offer datagram, resolves the broadcast address once
+    (again only when the interfaces change) and sends on its own thread, so every offer is a single
+    sendto and offer timing does not depend on what the accept loop is doing.
+    With a load_provider() -> (active_sessions, capacity), every plain offer is followed by an
+    extended one that advertises the load; old clients only look at the plain one.
+    """
+
+    def __init__(
+        self,
+        server_name: str,
+        tcp_port: int,
+        interval: float = 1.0,
+        refresh_interval: float = 30.0,
+        load_provider: Optional[Callable[[], Tuple[int, int]]] = None,
+        resolver: Optional[InterfaceResolver] = None,
+    ):
+        self.interval = interval
+        self.refresh_interval = refresh_interval
+        self.load_provider = load_provider
+        self.resolver = resolver if resolver is not None else default_resolver()
+        self._msg = pack_offer(server_name, tcp_port)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._target = None
+        self._next_refresh = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _refresh_target(self, force: bool = False):
+        """Re-resolve the broadcast address, but only if the IPv4 interfaces changed"""
+        changed = self.resolver.refresh()
+        if force or changed or self._target is None:
+            self._target = (self.resolver.broadcast_address(), BROADCAST_UDP_PORT)
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def send_offer(self):
+        """Send one offer datagram"""
+        if time.monotonic() >= self._next_refresh:
+            self._refresh_target()
+        try:
+            self._sock.sendto(self._msg, self._target)
+            if self.load_provider is not None:
+                self._sock.sendto(pack_offer_load(self._msg, *self.load_provider()), self._target)
+        except OSError:
+            # address probably went away with an interface, resolve again right away next time
+            self._next_refresh = 0.0
+            raise
+
+    def _run(self):
+        next_send = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.send_offer()
+            except (OSError, RuntimeError, ValueError) as e:
+                # any of these would end the thread, and the server would stop being discoverable without a word
+                print(f"[SERVER] Offer broadcast failed: {e}")
+            next_send += self.interval
+            self._stop.wait(max(0.0, next_send - time.monotonic()))
+
+    def start(self):
+        """Start announcing in the background"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="offer-announcer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop announcing and release the socket"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._sock.close()
+
+
+def create_offer_listener(timeout: Optional[float] = None) -> socket.socket:
+    """Client: UDP socket bound to the offer port (shareable with other clients on this host)"""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
     if hasattr(socket, "SO_REUSEPORT"):
@@ -46,48 +134,54 @@ def listen_for_offers(timeout: Optional[float] = None) -> Tuple[str, int, str]:
     sock.bind(('', BROADCAST_UDP_PORT))
     if timeout is not None:
         sock.settimeout(timeout)
+    return sock
+
+
+def parse_offer(data: bytes) -> Optional[Tuple[int, str, Optional[Tuple[int, int]]]]:
+    """
+    Return (tcp_port, server_name, load) of a valid offer datagram, None for anything else.
+    load is (active_sessions, capacity) for extended offers, None for plain ones.
+    """
+    if len(data) == MessageLength.OFFER.value:
+        load = None
+    elif len(data) == MessageLength.OFFER_LOAD.value:
+        load = _LOAD.unpack_from(data, MessageLength.OFFER.value)
+    else:
+        return None
 
-    while True:
-        data, addr = sock.recvfrom(1024)
+    magic, msg_type, tcp_port, server_name_bytes = struct.unpack_from(
+        MessageFormat.OFFER.value, data
+    )
 
-        if len(data) != MessageLength.OFFER.value:
-            continue
+    if magic != MAGIC_COOKIE or msg_type != MessageType.OFFER.value:
+        return None
 
-        magic, msg_type, tcp_port, server_name_bytes = struct.unpack(
-            MessageFormat.OFFER.value, data
-        )
+    return tcp_port, server_name_bytes.rstrip(b'\x00').decode(errors="replace"), load
 
-        if magic != MAGIC_COOKIE or msg_type != MessageType.OFFER.value:
-            continue
 
-        server_name = server_name_bytes.rstrip(b'\x00').decode()
-        return addr[0], tcp_port, server_name
+def listen_for_offers(timeout: Optional[float] = None) -> Tuple[str, int, str]:
+    """Client: listen for UDP offer, return (server_ip, tcp_port, server_name)"""
+    sock = create_offer_listener(timeout)
+    try:
+        while True:
+            data, addr = sock.recvfrom(1024)
+            offer = parse_offer(data)
+            if offer is not None:
+                return addr[0], offer[0], offer[1]
+    finally:
+        sock.close()
 
 
-#self explanetory
+#self explanetory - the address of the interface offers go out on (no outbound connection)
 def get_local_ip():
-    s=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
-    try:#just connect to google dns, and check our socket ip name
-        s.connect(("8.8.8.8",80))
-        return s.getsockname()[0]
-    finally:
-        s.close()
+    return default_resolver().local_ip()
 
 
-#calc subnet mask, check all interface until we reach the actual wifi interface and check the mask
+#subnet mask of that same interface
 def get_subnet_mask():
-    import psutil
-    local_ip = get_local_ip()
+    return default_resolver().netmask()
 
-    for iface, addrs in psutil.net_if_addrs().items():
-        for addr in addrs:
-            if addr.family == socket.AF_INET and addr.address == local_ip:
-                return addr.netmask
-    raise RuntimeError("Could not determine subnet mask")
 
-#simple calculations
+#broadcast address offers go to, cached until the interfaces change
 def get_broadcast_address():
-    ip = get_local_ip()
-    netmask = get_subnet_mask()
-    network = ipaddress.IPv4Network(f"{ip}/{netmask}", strict=False)
-    return str(network.broadcast_address)
\ No newline at end of file
+    return default_resolver().broadcast_address()
@@ -0,0 +1,192 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Callable, Optional
+import metrics
+import journal
+from networkManager import *
+from my_utils import DEFAULT_MAX_SESSIONS, DEFAULT_TURN_TIMEOUT
+from tcp import create_tcp_server, DEFAULT_BACKLOG
+from async_server import serve_async, AdmissionControl, OFFER_INTERVAL
+from table_server import TableManager
+from game import Shoe, shoe_factory
+
+'''multi-core server mode - pre-forks N worker processes that all accept on the same TCP port,
+each running the asyncio engine. the parent only broadcasts offers and collects worker stats'''
+
+_SLOTS = 3  # shared counters per worker: sessions, rounds, active sessions
+STATS_INTERVAL = 10.0  # seconds between stats reports
+SUPERVISE_INTERVAL = 1.0  # seconds between worker health checks
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _worker_main(
+    index: int,
+    server_sock: Optional[socket.socket],
+    tcp_port: int,
+    server_name: str,
+    max_sessions: int,
+    counters,
+    new_shoe: Callable[[str], Shoe],
+    backlog: int,
+    metrics_port: Optional[int],
+    journal_path: Optional[str],
+    table_size: Optional[int],
+    turn_timeout: float,
+):
+    """Worker process: run the asyncio engine, count sessions, rounds and active sessions into shared memory"""
+    if server_sock is None:
+        # SO_REUSEPORT - every worker gets its own listening socket on the shared port
+        server_sock = create_tcp_server(tcp_port, reuse_port=True, backlog=backlog)
+
+    base = _SLOTS * index
+    # a respawned worker starts with no sessions, whatever its crashed predecessor left in the slot
+    counters[base + 2] = 0
+
+    def on_session_done(rounds_played: int):
+        # each worker only writes its own slots, so no lock is needed
+        counters[base] += 1
+        counters[base + 1] += rounds_played
+
+    def on_load_change(active: int):
+        counters[base + 2] = active
+
+    if journal_path is not None:
+        journal.configure(f"{journal_path}.{index}")
+    if metrics_port is not None:
+        # every worker has its own registry, scraped on its own port (0: one the OS picks per worker)
+        port = metrics_port + index if metrics_port else 0
+        try:
+            stats = metrics.MetricsServer(port, {"worker": index})
+        except OSError as e:
+            # a worker that dies here would only be respawned into the same failure every second
+            print(f"[SERVER] Worker {index} serves no metrics, port {port}: {e}")
+        else:
+            stats.start()
+            print(f"[SERVER] Worker {index} metrics on 127.0.0.1:{stats.port}")
+
+    try:
+        asyncio.run(serve_async(
+            server_sock,
+            server_name,
+            max_sessions,
+            announce=False,
+            on_session_done=on_session_done,
+            new_shoe=new_shoe,
+            backlog=backlog,
+            admission=AdmissionControl(max_sessions, on_load_change),
+            tables=TableManager(new_shoe, table_size, turn_timeout) if table_size else None,
+        ))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # worker processes exit without running atexit hooks
+        journal.shutdown()
+
+
+def _report_stats(counters, num_workers: int, last_rounds: int, elapsed: float) -> int:
+    """Print per-worker session/round counts, returns the total rounds played so far"""
+    total_sessions = sum(counters[_SLOTS * i] for i in range(num_workers))
+    total_rounds = sum(counters[_SLOTS * i + 1] for i in range(num_workers))
+    per_worker = ", ".join(
+        f"w{i}={counters[_SLOTS * i]}s/{counters[_SLOTS * i + 1]}r" for i in range(num_workers)
+    )
+    rate = (total_rounds - last_rounds) / elapsed if elapsed > 0 else 0.0
+    print(f"[SERVER] Sessions: {total_sessions}, rounds: {total_rounds} ({rate:.1f} rounds/s) [{per_worker}]")
+    return total_rounds
+
+
+def run_worker_server(
+    server_name: str,
+    num_workers: int,
+    max_sessions: int = DEFAULT_MAX_SESSIONS,
+    new_shoe: Callable[[str], Shoe] = shoe_factory(),
+    backlog: int = DEFAULT_BACKLOG,
+    metrics_port: Optional[int] = None,
+    journal_path: Optional[str] = None,
+    table_size: Optional[int] = None,
+    turn_timeout: float = DEFAULT_TURN_TIMEOUT,
+):
+    """
+    Blocking entry point for the multi-process server.
+    With a metrics_port, worker i serves its metrics on metrics_port + i (on a free port each with 0),
+    with a journal_path, worker i journals its rounds to journal_path.i,
+    with a table_size, every worker seats its players at tables of that size.
+    """
+    if num_workers <= 0:
+        num_workers = os.cpu_count() or 1
+
+    # treat SIGTERM like ctrl+c, in the parent and in the (inheriting) workers
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    ctx = multiprocessing.get_context("fork")
+    counters = ctx.RawArray("Q", _SLOTS * num_workers)  # [sessions, rounds, active] per worker
+
+    if hasattr(socket, "SO_REUSEPORT"):
+        # the parent only reserves the port (bound, not listening) so it never takes connections itself
+        port_holder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        port_holder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        port_holder.bind(('', 0))
+        shared_sock = None
+    else:
+        # no SO_REUSEPORT - workers inherit one listening socket through fork
+        port_holder = create_tcp_server(backlog=backlog)
+        shared_sock = port_holder
+    tcp_port = port_holder.getsockname()[1]
+
+    print(f"[SERVER] Server started, listening on TCP port {tcp_port}")
+    print(f"[SERVER] Starting {num_workers} workers, up to {max_sessions} sessions each")
+    if table_size:
+        print(f"[SERVER] Seating players at tables of {table_size}, {turn_timeout:.1f}s per turn")
+    if metrics_port:
+        print(f"[SERVER] Metrics on 127.0.0.1:{metrics_port}-{metrics_port + num_workers - 1}")
+
+    def spawn(index: int) -> multiprocessing.Process:
+        proc = ctx.Process(
+            target=_worker_main,
+            args=(index, shared_sock, tcp_port, server_name, max_sessions, counters, new_shoe, backlog, metrics_port, journal_path,
+                  table_size, turn_timeout),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    workers = [spawn(i) for i in range(num_workers)]
+
+    def load() -> tuple[int, int]:
+        active = sum(counters[_SLOTS * i + 2] for i in range(num_workers))
+        return active, max_sessions * num_workers
+
+    announcer = OfferAnnouncer(server_name, tcp_port, OFFER_INTERVAL, load_provider=load)
+    announcer.start()
+
+    last_report = time.monotonic()
+    last_rounds = 0
+    try:
+        while True:
+            time.sleep(SUPERVISE_INTERVAL)
+
+            now = time.monotonic()
+            if now - last_report >= STATS_INTERVAL:
+                last_rounds = _report_stats(counters, num_workers, last_rounds, now - last_report)
+                last_report = now
+
+            for i, proc in enumerate(workers):
+                if not proc.is_alive():
+                    print(f"[SERVER] Worker {i} exited with code {proc.exitcode}, restarting")
+                    workers[i] = spawn(i)
+    except KeyboardInterrupt:
+        print("[SERVER] Shutting down.")
+    finally:
+        announcer.stop()
+        for proc in workers:
+            proc.terminate()
+        for proc in workers:
+            proc.join()
+        _report_stats(counters, num_workers, last_rounds, time.monotonic() - last_report)
+        port_holder.close()